@@ -1,4 +1,7 @@
 import os
+import socket
+import tempfile
+from uuid import uuid4
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists
@@ -10,5 +13,143 @@ TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH")
 TELEGRAM_PHONE = os.getenv("TELEGRAM_PHONE")
 PRIVATE_CHANNEL_ID = os.getenv("PRIVATE_CHANNEL_ID")
 
+# Phone numbers of the client pool, one session file each. Repeat a phone
+# number to open several sessions for the same account.
+TELEGRAM_SESSIONS = [
+    phone.strip()
+    for phone in os.getenv("TELEGRAM_SESSIONS", TELEGRAM_PHONE or "").split(",")
+    if phone.strip()
+]
+# Session file of the first session, the others get _2, _3, ... appended.
+# Uploader processes running side by side need one each.
+TELEGRAM_SESSION_FILE = os.getenv("TELEGRAM_SESSION_FILE", os.path.join("data", "tg_session"))
+
 # Database URL
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///tgupload.db") 
\ No newline at end of file
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///tgupload.db") 
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))  # Connections kept open
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))  # Extra connections opened under load
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+
+# SQLite tuning (the journal always uses WAL so reads don't block the writer)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is safe with WAL, FULL also survives power loss
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # Milliseconds to wait for the write lock
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes of the file read through mmap
+
+# Task status updates are written by a single coroutine in batches
+STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", "0.005"))  # Seconds to collect updates before a write
+STATUS_BATCH_SIZE = int(os.getenv("STATUS_BATCH_SIZE", "500"))  # Max updates per transaction
+
+# Task statuses served by /api/file/{task_id} without a database read
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "10000"))  # Tasks kept, 0 disables the cache
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "60"))  # Seconds before a task is read again
+
+# Retention of finished tasks
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))  # Age after which completed/failed tasks are removed, 0 keeps them
+RETENTION_ARCHIVE = os.getenv("RETENTION_ARCHIVE", "true").lower() == "true"  # Move them to tasks_archive instead of deleting
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))  # Tasks removed per transaction
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))  # Seconds between retention runs
+
+# Progress of running tasks
+PROGRESS_SPEED_INTERVAL = float(os.getenv("PROGRESS_SPEED_INTERVAL", "1"))  # Seconds over which the current speed is measured
+PROGRESS_WRITE_INTERVAL = float(os.getenv("PROGRESS_WRITE_INTERVAL", "2"))  # Seconds between progress writes by uploader.py, read by the API with RUN_UPLOADER=false
+
+# Messages sent per client, adapted to FloodWaits
+SEND_RATE = float(os.getenv("SEND_RATE", "1"))  # Messages per second per client, also the upper limit
+SEND_BURST = int(os.getenv("SEND_BURST", "5"))  # Messages sent at once after an idle period
+SEND_RATE_MIN = float(os.getenv("SEND_RATE_MIN", "0.05"))  # Floor the rate never goes below
+SEND_RATE_STEP = float(os.getenv("SEND_RATE_STEP", "0.01"))  # Increase per message sent without a FloodWait
+SEND_RATE_DECREASE = float(os.getenv("SEND_RATE_DECREASE", "0.5"))  # Factor applied on a FloodWait
+FLOOD_WAIT_MAX = int(os.getenv("FLOOD_WAIT_MAX", "120"))  # Longer FloodWaits fail the task instead of waiting
+
+# Retries of downloads and Telegram sends after transient errors
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))  # Attempts in total, 1 disables retries
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # Seconds before the first retry, doubled after each one
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))  # Longest wait between two attempts
+RETRY_HTTP_STATUSES = {
+    int(status) for status in os.getenv("RETRY_HTTP_STATUSES", "429,500,502,503,504").split(",") if status.strip()
+}  # HTTP statuses of the source that are retried, others fail the download
+
+# Download settings
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))  # Bytes read per chunk
+MAX_DOWNLOAD_SIZE = int(os.getenv("MAX_DOWNLOAD_SIZE", str(2000 * 1024 * 1024)))  # Telegram's file size limit
+# Upload while downloading when the size is known. Videos and audio are still
+# spooled, their metadata is read from the file before they are sent.
+PIPELINE_UPLOADS = os.getenv("PIPELINE_UPLOADS", "true").lower() == "true"
+
+# Big downloads are split into byte ranges fetched over several connections,
+# for sources that throttle each connection. Big files are saved to disk
+# this way even when PIPELINE_UPLOADS is on.
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))  # Connections per download, 1 disables segmented downloads
+SEGMENTED_DOWNLOAD_SIZE = int(os.getenv("SEGMENTED_DOWNLOAD_SIZE", str(20 * 1024 * 1024)))  # Smaller files use one connection
+
+# Files sent to /api/upload/file are kept here until they are uploaded (MAX_DOWNLOAD_SIZE applies too).
+# With RUN_UPLOADER=false it must be storage shared by the API and every uploader process.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "tgupload"))
+
+# Downloads waiting to be uploaded. Each uploader process uses a directory of
+# its own below SPOOL_DIR, and removes those of stopped processes on start.
+SPOOL_DIR = os.getenv("SPOOL_DIR", os.path.join(tempfile.gettempdir(), "tgupload-spool"))  # Fast local disk or tmpfs
+SPOOL_MAX_SIZE = int(os.getenv("SPOOL_MAX_SIZE", str(10 * 1024 * 1024 * 1024)))  # New downloads wait while the files on disk take more bytes
+SPOOL_MEMORY_THRESHOLD = int(os.getenv("SPOOL_MEMORY_THRESHOLD", str(4 * 1024 * 1024)))  # Smaller files stay in memory, 0 writes all to disk
+
+# HTTP client settings (one pooled session is shared by all downloads)
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", "100"))  # Max open connections in total
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))  # Max open connections per host
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))  # Seconds to cache DNS lookups
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))  # Seconds to establish a connection
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))  # Seconds to wait for the next chunk
+
+# Task queue settings
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "8"))  # Tasks processed at the same time
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "1000"))  # Waiting tasks before new uploads are rejected
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "5"))  # Seconds between checks for pending tasks
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "1000"))  # URLs accepted by one batch request
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "4"))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "4"))
+
+# Process layout. By default the API process also runs the uploads. With
+# RUN_UPLOADER=false it only writes and reads tasks, so several API processes
+# can run, and uploader.py processes the tasks in separate processes.
+RUN_UPLOADER = os.getenv("RUN_UPLOADER", "true").lower() == "true"
+# Name of this process in task rows and logs. The default adds a random
+# suffix to the host name, as several processes may run on one host.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{uuid4().hex[:8]}"  # Must be unique when set
+# Uploaders renew the claim on their tasks, a task whose claim expired is
+# taken over by another uploader, e.g. after a crash or a new container
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "120"))
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", "1"))  # Seconds between status reads for waiting clients without RUN_UPLOADER
+# uploader.py serves /metrics, /api/stats and /api/rate-limits of its own process here
+UPLOADER_HTTP_HOST = os.getenv("UPLOADER_HTTP_HOST", "0.0.0.0")
+UPLOADER_HTTP_PORT = int(os.getenv("UPLOADER_HTTP_PORT", "8001"))  # 0 disables it, must differ between uploaders on one host
+
+# Big files (over 10 MB) are uploaded over several connections in parallel
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))  # Connections per upload, 1 disables parallel uploads
+UPLOAD_PART_SIZE_KB = int(os.getenv("UPLOAD_PART_SIZE_KB", "512"))  # Telegram allows at most 512
+UPLOAD_MAX_PARTS = 4000  # Parts Telegram accepts per file
+# Telegram refuses other part sizes only once the upload is under way
+if not 0 < UPLOAD_PART_SIZE_KB <= 512 or 512 % UPLOAD_PART_SIZE_KB:
+    raise ValueError(f"UPLOAD_PART_SIZE_KB must be at most 512 and divide it evenly, got {UPLOAD_PART_SIZE_KB}")
+if -(-MAX_DOWNLOAD_SIZE // (UPLOAD_PART_SIZE_KB * 1024)) > UPLOAD_MAX_PARTS:
+    raise ValueError(
+        f"UPLOAD_PART_SIZE_KB={UPLOAD_PART_SIZE_KB} splits files of MAX_DOWNLOAD_SIZE into more than "
+        f"{UPLOAD_MAX_PARTS} parts, use bigger parts or a lower MAX_DOWNLOAD_SIZE"
+    )
+
+# Video and audio metadata is read with hachoir, and video thumbnails made with ffmpeg, in worker processes.
+# Files sent as documents skip it.
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))  # Processes in the pool, 0 uses a thread of this process
+VIDEO_THUMBNAILS = os.getenv("VIDEO_THUMBNAILS", "true").lower() == "true"  # Made with ffmpeg, skipped if it isn't installed
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+METADATA_TIMEOUT = float(os.getenv("METADATA_TIMEOUT", "30"))  # Seconds ffmpeg may take for a thumbnail
+
+# Reuse already uploaded media for repeated URLs and content. Content only
+# skips the upload for files downloaded to disk first, since pipelined
+# uploads are already sent by the time the hash is known.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+
+# Completion notifications
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "60"))  # Longest wait allowed on /api/file/{task_id}
+EVENTS_MAX_TASKS = int(os.getenv("EVENTS_MAX_TASKS", "1000"))  # Task IDs accepted by one /api/events stream
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))  # Seconds per delivery attempt
+WEBHOOK_RETRY_DELAY = float(os.getenv("WEBHOOK_RETRY_DELAY", "2"))  # Doubles after every failed attempt
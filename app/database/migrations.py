@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(conn, metadata):
+    """Add columns that exist in the models but not yet in the database.
+
+    create_all() only creates missing tables, so a database created by an
+    older version would otherwise lack every column added since. Runs on a
+    sync connection, use AsyncConnection.run_sync() from async code.
+    """
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+def add_missing_indexes(conn, metadata):
+    """Create indexes that exist in the models but not yet in the database.
+
+    Like columns, indexes added to an existing table are skipped by
+    create_all(). Building one on a big table takes a while, but only once.
+    """
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+
+            index.create(conn)
+            logger.info(f"Added index {index.name}")
+
+async def init_db(engine, metadata, attempts=3):
+    """Create missing tables, columns and indexes.
+
+    API and uploader processes may start at the same time. The one that
+    loses a race to create something fails and finds it in place on the
+    next attempt.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+                await conn.run_sync(add_missing_columns, metadata)
+                await conn.run_sync(add_missing_indexes, metadata)
+            return
+        except DBAPIError as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"Schema update failed, retrying: {str(e)}")
+            await asyncio.sleep(attempt)
@@ -1,19 +1,53 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
-
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import (
+    DATABASE_URL, DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT,
+    SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_async_url(url):
+    """Use the asyncio driver of the configured database"""
+    url = make_url(url)
+    if url.drivername in ("sqlite", "sqlite+pysqlite"):
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return url.set(drivername="postgresql+asyncpg")
+    return url
+
+database_url = get_async_url(DATABASE_URL)
+pool_options = {
+    "pool_size": DATABASE_POOL_SIZE,
+    "max_overflow": DATABASE_MAX_OVERFLOW,
+    "pool_timeout": DATABASE_POOL_TIMEOUT,
+}
+if database_url.get_backend_name() == "sqlite":
+    # aiosqlite opens a new connection (and thread) per session by default
+    if database_url.database in (None, "", ":memory:"):
+        pool_options = {}
+    else:
+        pool_options["poolclass"] = AsyncAdaptedQueuePool
+
+engine = create_async_engine(database_url, **pool_options)
+
+if database_url.get_backend_name() == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Let readers and the writer work at the same time"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+# Keep objects usable after commit, async sessions can't lazy load expired attributes
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
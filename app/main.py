@@ -1,15 +1,34 @@
+import os
 import asyncio
+import json
 import logging
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+import tempfile
+from datetime import datetime
+from uuid import uuid4
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.setup import get_db, engine, Base
+from app.database.setup import get_db, engine, Base, SessionLocal
+from app.database.migrations import init_db
 from app.models.task import Task
-from app.models.schemas import UploadRequest, TaskResponse, FileResponse, ProgressResponse
+from app.models.schemas import (
+    UploadRequest, BatchUploadRequest, FileUploadForm, TaskResponse, BatchTaskResponse, FileResponse,
+    ProgressResponse,
+)
 from app.services.telegram import telegram_service
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+from app.services.queue import task_queue
+from app.services.notifier import task_notifier, FINAL_STATUSES
+from app.services.status_cache import task_cache
+from app.services.status_poller import status_poller
+from app.services.progress import task_progress
+from app.services.uploads import FileUpload, UploadTooLarge
+from app.services import uploader
+from app.config import BATCH_MAX_SIZE, LONG_POLL_MAX_WAIT, EVENTS_MAX_TASKS, RUN_UPLOADER, UPLOAD_DIR
 
 # Configure logging
 logging.basicConfig(
@@ -46,15 +65,16 @@ app = FastAPI(
     
     ## Features
     
-    * Upload files to a private Telegram channel by providing a URL
-    * Get task status by task ID (with polling)
+    * Upload files to a private Telegram channel by providing a URL, or by sending the file itself
+    * Get task status by task ID (with polling or long polling)
+    * Follow many tasks at once over Server-Sent Events, or get a webhook call when a task is done
     
     ## How it works
     
     1. Send a POST request to `/api/upload` with a URL
     2. The service will download the file and upload it to a private Telegram channel
     3. The file is uploaded with the task ID in the caption
-    4. You can integrate your own bot to monitor the channel and extract file IDs
+    4. The task result contains the message ID and the media's ID, access hash and file reference
     """,
     version="1.0.0",
 )
@@ -63,88 +83,278 @@ app = FastAPI(
 async def startup_event():
     """Start the Telegram client on application startup"""
     logger.info("=== Starting Telegram Upload API ===")
-    try:
-        # Start Telegram client
-        await telegram_service.start()
+    
+    # Create tables and add columns introduced since the database was created
+    await init_db(engine, Base.metadata)
+    
+    if RUN_UPLOADER:
+        # Start the Telegram client and the queue workers
+        await uploader.start()
         logger.info("API startup complete")
-    except Exception as e:
-        logger.error(f"Failed to start services: {str(e)}")
+    else:
+        # Tasks are processed by uploader.py, read what waiting clients need from the database
+        await status_poller.start()
+        if os.path.commonpath([os.path.abspath(UPLOAD_DIR), tempfile.gettempdir()]) == tempfile.gettempdir():
+            logger.warning(f"UPLOAD_DIR {UPLOAD_DIR} is in the local temp directory, uploaders in other containers or hosts can't read files sent to /api/upload/file")
+        logger.info("API startup complete, uploads run in separate uploader processes")
     
     logger.info("===============================")
 
-async def process_upload(task_id: str, url: str, db: Session):
-    """Process file upload in background"""
-    try:
-        # Update task status to processing
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if not task:
-            logger.error(f"Task {task_id} not found")
-            return
-        
-        task.status = "processing"
-        db.commit()
-        
-        # Upload file to Telegram channel
-        logger.info(f"Processing: {task_id[:8]}... - {url}")
-        
-        result = await telegram_service.upload_file_to_channel(url, task_id, force_document=task.force_document)
-        
-        # Update task with channel message ID and status
-        task.channel_message_id = str(result["message_id"])
-        task.status = "completed"
-        db.commit()
-        
-        logger.info(f"Completed: {task_id[:8]}... - Message ID: {result['message_id']}")
-    except Exception as e:
-        # Update task status to failed
-        logger.error(f"Failed: {task_id[:8]}... - {str(e)}")
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if task:
-            task.status = "failed"
-            task.error_message = str(e)
-            db.commit()
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the workers and release connections on application shutdown"""
+    if RUN_UPLOADER:
+        await uploader.stop()
+    else:
+        await status_poller.stop()
+    await engine.dispose()
 
 @app.post("/api/upload", response_model=TaskResponse, 
           summary="Upload a file from URL to Telegram channel",
           description="Provide a URL to a file, and the service will download it and upload it to a private Telegram channel. Returns a task ID that can be used to check the status.")
 async def upload_file(
     request: UploadRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Endpoint to upload a file from URL to Telegram channel"""
+    # Apply backpressure while the workers are saturated
+    if task_queue.is_full():
+        logger.warning("Upload queue is full")
+        raise HTTPException(status_code=503, detail="Upload queue is full, try again later")
+    
     # Create a new task
-    task = Task(url=str(request.url), force_document=request.force_document)
+    task = Task(
+        url=str(request.url),
+        force_document=request.force_document,
+        callback_url=str(request.callback_url) if request.callback_url else None,
+    )
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    await db.commit()
+    await db.refresh(task)
     
     logger.info(f"Created: {task.id[:8]}... - {request.url}")
     
-    # Process upload in background
-    background_tasks.add_task(process_upload, task.id, str(request.url), db)
+    # Hand the task to the queue workers
+    task_queue.enqueue(task.id)
+    
+    return task
+
+@app.post("/api/upload/file", response_model=TaskResponse,
+          summary="Upload a file to Telegram channel",
+          description="Send the file as multipart/form-data in any file field, with optional `force_document` and `callback_url` form fields. The body is saved to disk while it is received and then uploaded like a file from a URL. Returns a task ID that can be used to check the status.")
+async def upload_local_file(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Endpoint to upload a file sent in the request to Telegram channel"""
+    # Apply backpressure while the workers are saturated
+    if task_queue.is_full():
+        logger.warning("Upload queue is full")
+        raise HTTPException(status_code=503, detail="Upload queue is full, try again later")
+    
+    upload = FileUpload()
+    try:
+        await upload.receive(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        form = FileUploadForm(**upload.fields)
+    except ValidationError as e:
+        upload.discard()
+        raise RequestValidationError(e.errors())
+    
+    # Create a new task
+    task = Task(
+        url=f"upload:{upload.filename}",
+        local_path=upload.path,
+        force_document=form.force_document,
+        callback_url=str(form.callback_url) if form.callback_url else None,
+    )
+    try:
+        db.add(task)
+        await db.commit()
+        await db.refresh(task)
+    except BaseException:
+        upload.discard()
+        raise
+    
+    logger.info(f"Created: {task.id[:8]}... - {upload.filename}")
+    
+    # Hand the task to the queue workers
+    task_queue.enqueue(task.id)
     
     return task
 
+@app.post("/api/upload/batch", response_model=BatchTaskResponse,
+          summary="Upload many files from URLs to Telegram channel",
+          description="Same as /api/upload for a list of URLs, created in one transaction. With group_photos, photo URLs are sent as albums of up to 10. Returns the tasks in request order.")
+async def upload_batch(
+    request: BatchUploadRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Endpoint to upload files from many URLs to Telegram channel"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No URLs given")
+    if len(request.items) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_SIZE} URLs per batch")
+    
+    # Apply backpressure while the workers are saturated
+    if task_queue.is_full():
+        logger.warning("Upload queue is full")
+        raise HTTPException(status_code=503, detail="Upload queue is full, try again later")
+    
+    # Build all rows up front so they go in with a single INSERT
+    now = datetime.utcnow()
+    rows = []
+    album = []
+    for item in request.items:
+        row = {
+            "id": str(uuid4()),
+            "url": str(item.url),
+            "force_document": item.force_document,
+            "callback_url": str(item.callback_url) if item.callback_url else None,
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now,
+            "album_id": None,
+        }
+        rows.append(row)
+        
+        if request.group_photos and not item.force_document and telegram_service.guess_file_type(row["url"]) == "photo":
+            album.append(row)
+            if len(album) > 1:
+                for member in album:
+                    member["album_id"] = album[0]["id"]
+            # Telegram allows at most 10 files per album
+            if len(album) == 10:
+                album = []
+    
+    await db.execute(insert(Task), rows)
+    await db.commit()
+    
+    logger.info(f"Created: {len(rows)} tasks in one batch")
+    
+    # Album members are processed with the first task of their album
+    for row in rows:
+        if row["album_id"] in (None, row["id"]):
+            task_queue.enqueue(row["id"])
+    
+    return {"tasks": rows}
+
 @app.get("/api/file/{task_id}", response_model=FileResponse,
          summary="Get file status for a specific task",
-         description="Returns the task status and channel message ID when the upload is complete. If the file is not ready, returns status code 425 with current status.")
-async def get_file(task_id: str, db: Session = Depends(get_db)):
+         description="Returns the task status, channel message ID and media details (ID, access hash, file reference, size, MIME type, dimensions) when the upload is complete. If the file is not ready, returns status code 425 with current status and, while processing, the transferred bytes, speed and ETA. With `wait`, holds the request for up to that many seconds until the task completes or fails.")
+async def get_file(
+    task_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the task to finish (long polling)"),
+    db: AsyncSession = Depends(get_db)
+):
     """Endpoint to get file status for a specific task"""
-    task = db.query(Task).filter(Task.id == task_id).first()
-    
-    if not task:
-        logger.warning(f"Task not found: {task_id}")
-        raise HTTPException(status_code=404, detail="Task not found")
+    # Subscribe before reading, so a change in between isn't missed
+    with task_notifier.subscribe([task_id]) as subscription:
+        # Workers keep the cache up to date, only unknown tasks are read
+        task = task_cache.get(task_id)
+        if task is None:
+            row = await db.get(Task, task_id)
+            
+            if not row:
+                logger.warning(f"Task not found: {task_id}")
+                raise HTTPException(status_code=404, detail="Task not found")
+            
+            task = task_cache.fill(FileResponse.model_validate(row).dict())
+            
+            # Give the connection back to the pool while waiting
+            await db.commit()
+        
+        # Wait for the worker to finish the task, the events carry the whole result
+        deadline = asyncio.get_running_loop().time() + min(wait, LONG_POLL_MAX_WAIT)
+        while task["status"] not in FINAL_STATUSES:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            event = await subscription.get(remaining)
+            if not event:
+                break
+            task = event
     
     # If task is completed or failed, return result immediately
-    if task.status in ["completed", "failed"]:
+    if task["status"] in FINAL_STATUSES:
         return task
     
+    progress = task_progress.get_info(task["id"])
+    if progress is None and task["status"] == "processing" and not RUN_UPLOADER:
+        # Running in an uploader process, which writes its progress to the task
+        written = await db.scalar(select(Task.progress).where(Task.id == task["id"]))
+        progress = json.loads(written) if written else None
+    
     # If task is still processing, return 425 status code
     progress_response = ProgressResponse(
-        id=task.id, 
-        status=task.status, 
-        message="File is still being processed"
+        id=task["id"], 
+        status=task["status"], 
+        message="File is still being processed",
+        progress=progress,
     )
-    raise HTTPException(status_code=425, detail=progress_response.dict()) 
\ No newline at end of file
+    raise HTTPException(status_code=425, detail=progress_response.dict())
+
+@app.get("/api/events",
+         summary="Stream status changes of tasks",
+         description="Server-Sent Events stream of status changes for the comma separated task IDs in `ids`. Sends the current status of every task first and closes once all of them are completed or failed.")
+async def stream_events(ids: str = Query(..., description="Comma separated task IDs")):
+    """Endpoint to stream task status changes"""
+    task_ids = list(dict.fromkeys(task_id.strip() for task_id in ids.split(",") if task_id.strip()))
+    if not task_ids:
+        raise HTTPException(status_code=400, detail="No task IDs given")
+    if len(task_ids) > EVENTS_MAX_TASKS:
+        raise HTTPException(status_code=413, detail=f"At most {EVENTS_MAX_TASKS} task IDs per stream")
+    
+    async def events():
+        # Subscribe before reading, so a change in between isn't missed
+        with task_notifier.subscribe(task_ids) as subscription:
+            async with SessionLocal() as db:
+                result = await db.execute(select(Task).where(Task.id.in_(task_ids)))
+                initial = [FileResponse.model_validate(task).dict() for task in result.scalars()]
+            
+            # Unknown IDs would never finish, so only wait for known unfinished tasks
+            pending = {event["id"] for event in initial if event["status"] not in FINAL_STATUSES}
+            
+            for event in initial:
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+            
+            while pending:
+                event = await subscription.get(15)
+                if not event:
+                    # Keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+                if event["status"] in FINAL_STATUSES:
+                    pending.discard(event["id"])
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/api/stats",
+         summary="Get service statistics",
+         description="Returns runtime counters of the service, such as HTTP connection reuse and queue depth. With RUN_UPLOADER=false the uploads run elsewhere, each uploader.py serves its own on UPLOADER_HTTP_PORT.")
+async def get_stats():
+    """Endpoint to get service statistics"""
+    stats = uploader.get_stats()
+    stats["status_poller"] = status_poller.get_stats()
+    return stats 
+
+@app.get("/api/rate-limits",
+         summary="Get the send rate of the Telegram clients",
+         description="Returns, per client, the current and maximum messages per second, available tokens, seconds left in a FloodWait pause and the FloodWaits seen so far. Empty with RUN_UPLOADER=false, each uploader.py serves its own on UPLOADER_HTTP_PORT.")
+async def get_rate_limits():
+    """Endpoint to get the rate limiter state"""
+    return telegram_service.get_rate_limits()
+
+@app.get("/metrics",
+         summary="Prometheus metrics",
+         description="Latency histograms per stage, transferred bytes, throughput, in-flight gauges, FloodWaits and failures in the Prometheus text format. With RUN_UPLOADER=false the upload metrics are scraped from each uploader.py on UPLOADER_HTTP_PORT.")
+async def get_metrics():
+    """Endpoint to scrape metrics"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, Integer, DateTime, Boolean
+from sqlalchemy.sql import func
+
+from app.database.setup import Base
+
+class MediaCache(Base):
+    __tablename__ = "media_cache"
+
+    content_hash = Column(String, primary_key=True)  # SHA-256 of the file content
+    channel_id = Column(String, nullable=False)
+    message_id = Column(String, nullable=False)  # Latest message carrying this media
+    media_type = Column(String, nullable=False)  # photo or document
+    media_id = Column(String, nullable=False)
+    access_hash = Column(String, nullable=False)
+    file_reference = Column(String, nullable=True)  # Hex encoded, expires after a while
+    file_name = Column(String, nullable=True)
+    file_type = Column(String, nullable=True)  # photo, video, audio or document, as it was sent
+    content_format = Column(String, nullable=True)  # Format found in the first bytes, e.g. jpeg or mp4
+    force_document = Column(Boolean, nullable=True)  # Sent as a document because the task asked for it
+    size = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class UrlCache(Base):
+    __tablename__ = "url_cache"
+
+    url = Column(String, primary_key=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String, nullable=False)  # Content served the last time
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -1,10 +1,20 @@
 from pydantic import BaseModel, HttpUrl
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 class UploadRequest(BaseModel):
     url: HttpUrl
     force_document: bool = False
+    callback_url: Optional[HttpUrl] = None  # Receives a POST with the FileResponse when done
+
+class FileUploadForm(BaseModel):
+    # Form fields sent along with the file to /api/upload/file
+    force_document: bool = False
+    callback_url: Optional[HttpUrl] = None
+
+class BatchUploadRequest(BaseModel):
+    items: List[UploadRequest]
+    group_photos: bool = False  # Send photos in albums of up to 10
 
 class TaskResponse(BaseModel):
     id: str
@@ -15,16 +25,39 @@ class TaskResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BatchTaskResponse(BaseModel):
+    tasks: List[TaskResponse]
+
 class FileResponse(BaseModel):
     id: str
     channel_message_id: Optional[str] = None
     status: str
     error_message: Optional[str] = None
+    media_type: Optional[str] = None
+    media_id: Optional[str] = None
+    access_hash: Optional[str] = None
+    file_reference: Optional[str] = None
+    file_size: Optional[int] = None
+    mime_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[int] = None
+    content_format: Optional[str] = None
+    sent_as: Optional[str] = None
     
     class Config:
         from_attributes = True
 
+class TaskProgress(BaseModel):
+    phase: str  # downloading, uploading or transferring (both at once)
+    downloaded_bytes: int
+    uploaded_bytes: int
+    total_bytes: Optional[int] = None
+    speed: float  # Bytes per second
+    eta: Optional[float] = None  # Seconds until the current phase is done
+
 class ProgressResponse(BaseModel):
     id: str
     status: str
-    message: str 
\ No newline at end of file
+    message: str
+    progress: Optional[TaskProgress] = None  # Only while processing 
\ No newline at end of file
@@ -1,17 +1,48 @@
-from sqlalchemy import Column, String, DateTime, Boolean
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, BigInteger, Index
 from sqlalchemy.sql import func
 from uuid import uuid4
 
 from app.database.setup import Base
 
-class Task(Base):
-    __tablename__ = "tasks"
+class TaskColumns:
+    """Columns shared by live and archived tasks"""
 
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid4()))
     url = Column(String, nullable=False)
     channel_message_id = Column(String, nullable=True)  # Message ID in the private channel
+    media_type = Column(String, nullable=True)  # photo or document
+    media_id = Column(String, nullable=True)  # Telegram photo/document ID
+    access_hash = Column(String, nullable=True)
+    file_reference = Column(String, nullable=True)  # Hex encoded
+    file_size = Column(BigInteger, nullable=True)
+    mime_type = Column(String, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration = Column(Integer, nullable=True)  # Seconds, for videos and audio
+    content_format = Column(String, nullable=True)  # Format found in the first bytes, e.g. jpeg or mp4
+    sent_as = Column(String, nullable=True)  # photo, video, audio or document, as decided before sending
     status = Column(String, default="pending")  # pending, processing, completed, failed
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     error_message = Column(String, nullable=True)
-    force_document = Column(Boolean, default=False)  # Whether to force send as document 
\ No newline at end of file
+    force_document = Column(Boolean, default=False)  # Whether to force send as document
+    callback_url = Column(String, nullable=True)  # Webhook notified when the task completes or fails
+    album_id = Column(String, nullable=True)  # ID of the first task of the album this photo is sent in 
+    local_path = Column(String, nullable=True)  # File received by /api/upload/file, deleted once the task is done
+    worker_id = Column(String, nullable=True)  # Uploader process that claimed the task
+    claimed_at = Column(DateTime, nullable=True)  # Renewed while the uploader works on the task
+    progress = Column(String, nullable=True)  # JSON progress written by uploader processes while running
+
+class Task(TaskColumns, Base):
+    __tablename__ = "tasks"
+    __table_args__ = (
+        # Recovery, the queue feeder and retention look tasks up by status and age
+        Index("ix_tasks_status_created_at", "status", "created_at"),
+        Index("ix_tasks_url", "url"),
+    )
+
+class TaskArchive(TaskColumns, Base):
+    """Finished tasks moved out of the tasks table by the retention job"""
+    __tablename__ = "tasks_archive"
+
+    archived_at = Column(DateTime, default=func.now())
@@ -0,0 +1,68 @@
+import logging
+from sqlalchemy import delete
+
+from app.database.setup import SessionLocal
+from app.models.media import MediaCache, UrlCache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+async def get_url_entry(url):
+    """Get what the source served the last time this URL was uploaded"""
+    async with SessionLocal() as db:
+        return await db.get(UrlCache, url)
+
+def get_conditional_headers(entry):
+    """Build request headers that let the source answer 304 Not Modified"""
+    headers = {}
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+async def forget_url(url):
+    """Drop the URL entry so the next upload does a full download"""
+    async with SessionLocal() as db:
+        await db.execute(delete(UrlCache).where(UrlCache.url == url))
+        await db.commit()
+
+async def find_media(content_hash):
+    """Get media previously uploaded with the same content"""
+    async with SessionLocal() as db:
+        return await db.get(MediaCache, content_hash)
+
+def matches(media, force_document):
+    """Whether previously uploaded media was sent the way a task asks for.
+
+    A photo or video can't be resent as a document, and media forced to a
+    document shouldn't be resent for a task that wants it shown as media.
+    """
+    if force_document:
+        return media.file_type == "document"
+    return not media.force_document
+
+async def remember(url, content_hash, reference, etag=None, last_modified=None):
+    """Store the media reference of a sent message for later reuse"""
+    async with SessionLocal() as db:
+        try:
+            media = await db.get(MediaCache, content_hash)
+            if not media:
+                media = MediaCache(content_hash=content_hash)
+                db.add(media)
+            for key, value in reference.items():
+                setattr(media, key, value)
+
+            # Only URLs the source can validate are worth remembering
+            if etag or last_modified:
+                await db.merge(UrlCache(
+                    url=url,
+                    etag=etag,
+                    last_modified=last_modified,
+                    content_hash=content_hash,
+                ))
+
+            await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to store media reference: {str(e)}")
+            await db.rollback()
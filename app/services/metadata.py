@@ -0,0 +1,139 @@
+import io
+import shutil
+import asyncio
+import logging
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from telethon import utils
+from telethon.tl.types import DocumentAttributeFilename, DocumentAttributeVideo
+
+from app.config import METADATA_WORKERS, VIDEO_THUMBNAILS, FFMPEG_BINARY, METADATA_TIMEOUT
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Telegram's limits for thumbnails
+THUMBNAIL_SIZE = 320  # Pixels of the longer side
+THUMBNAIL_MAX_BYTES = 200 * 1024
+
+class _NamedStream:
+    """A file Telethon takes the media type of from name, like it does for a path"""
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+def extract_metadata(source, filename, file_type, thumbnails=False):
+    """Read the attributes of a video or audio file, with a thumbnail for videos.
+
+    source is the path or the bytes of the file, filename the name it is
+    sent under. Runs in a worker process. Returns (attributes, thumb) with
+    thumb as JPEG bytes, or None. Thumbnails are only made of files on disk.
+    """
+    stream = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    with stream:
+        attributes, _ = utils.get_attributes(_NamedStream(stream, filename), supports_streaming=file_type == "video")
+    # Leave the name to the uploaded handle
+    attributes = [attr for attr in attributes if not isinstance(attr, DocumentAttributeFilename)]
+
+    thumb = None
+    if thumbnails and file_type == "video" and isinstance(source, str):
+        duration = next((attr.duration for attr in attributes if isinstance(attr, DocumentAttributeVideo)), 0)
+        thumb = _make_thumbnail(source, duration)
+    return attributes, thumb
+
+def _make_thumbnail(path, duration):
+    # The first frame is often black, take one a second in or from the middle of shorter videos
+    position = min(1, duration / 2)
+    command = [
+        FFMPEG_BINARY, "-v", "error", "-ss", str(position), "-i", path, "-frames:v", "1",
+        "-vf", f"scale={THUMBNAIL_SIZE}:{THUMBNAIL_SIZE}:force_original_aspect_ratio=decrease",
+        "-q:v", "5", "-f", "mjpeg", "pipe:1",
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=METADATA_TIMEOUT, check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Failed to make a thumbnail of {path}: {str(e)}")
+        return None
+
+    if not result.stdout or len(result.stdout) > THUMBNAIL_MAX_BYTES:
+        return None
+    return result.stdout
+
+class MetadataExtractor:
+    """Reads media metadata and makes thumbnails in a pool of worker processes.
+
+    Parsing a video is CPU-bound and would block the event loop with every
+    download, upload and API request on it. Without worker processes the
+    work runs in the loop's thread pool, which keeps the loop responsive
+    but shares the GIL with it.
+    """
+
+    def __init__(self, workers=METADATA_WORKERS):
+        self.workers = workers
+        self.thumbnails = VIDEO_THUMBNAILS and shutil.which(FFMPEG_BINARY) is not None
+        self.pool = None
+        self.files = 0
+        self.thumbs = 0
+        self.failures = 0
+        self.seconds = 0
+
+    def _get_pool(self):
+        if self.pool is None and self.workers > 0:
+            # Forking would copy the event loop and the threads of this process
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(
+                f"Metadata pool started ({self.workers} processes, thumbnails {'on' if self.thumbnails else 'off'})"
+            )
+        return self.pool
+
+    def stop(self):
+        """Shut down the worker processes"""
+        if self.pool:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+    async def extract(self, source, filename, file_type):
+        """Get (attributes, thumb) of a file, both None if it couldn't be read"""
+        loop = asyncio.get_running_loop()
+        attributes, thumb = None, None
+        with metrics.Stage("metadata") as stage:
+            try:
+                attributes, thumb = await loop.run_in_executor(
+                    self._get_pool(), extract_metadata, source, filename, file_type, self.thumbnails,
+                )
+            except BrokenProcessPool as e:
+                # A worker died, start new ones for the next file
+                self.failures += 1
+                self.pool = None
+                logger.error(f"Metadata worker failed on {filename}: {str(e)}")
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Failed to read metadata of {filename}: {str(e)}")
+
+        metrics.METADATA_SECONDS.observe(stage.seconds)
+        self.files += 1
+        self.seconds += stage.seconds
+        if thumb:
+            self.thumbs += 1
+        return attributes, thumb
+
+    def get_stats(self):
+        """Get metadata stage statistics"""
+        return {
+            "workers": self.workers,
+            "thumbnails": self.thumbnails,
+            "files": self.files,
+            "thumbnails_made": self.thumbs,
+            "failures": self.failures,
+            "seconds": round(self.seconds, 3),
+        }
+
+# Create a singleton instance
+metadata_extractor = MetadataExtractor()
@@ -0,0 +1,75 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages take anything from milliseconds to many minutes for big files
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+THROUGHPUT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100)
+FLOOD_WAIT_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600, 86400)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "tgupload_queue_wait_seconds", "Time from task creation until a worker picks it up",
+    buckets=TIME_BUCKETS,
+)
+DOWNLOAD_SECONDS = Histogram(
+    "tgupload_download_seconds", "Time to download a file to disk",
+    buckets=TIME_BUCKETS,
+)
+METADATA_SECONDS = Histogram(
+    "tgupload_metadata_seconds", "Time to read media metadata and make a thumbnail",
+    buckets=TIME_BUCKETS,
+)
+UPLOAD_SECONDS = Histogram(
+    "tgupload_upload_seconds", "Time to upload a file to Telegram and send it",
+    ["method"], buckets=TIME_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    "tgupload_db_seconds", "Time spent waiting for the database per task",
+    ["operation"], buckets=TIME_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    "tgupload_task_seconds", "Time to process a task, from pickup to result",
+    ["status"], buckets=TIME_BUCKETS,
+)
+THROUGHPUT = Histogram(
+    "tgupload_throughput_megabytes_per_second", "Transfer speed per file",
+    ["direction"], buckets=THROUGHPUT_BUCKETS,
+)
+BYTES = Counter("tgupload_bytes", "Bytes transferred", ["direction"])
+IN_FLIGHT = Gauge("tgupload_in_flight", "Tasks and transfers in progress", ["stage"])
+FLOOD_WAIT_SECONDS = Histogram(
+    "tgupload_flood_wait_seconds", "FloodWait durations imposed by Telegram",
+    buckets=FLOOD_WAIT_BUCKETS,
+)
+FAILURES = Counter("tgupload_failures", "Failed tasks by exception type", ["exception"])
+RETRIES = Counter("tgupload_retries", "Attempts retried after a transient error", ["operation"])
+SEND_FALLBACKS = Counter(
+    "tgupload_send_fallbacks", "Files sent again as a document after Telegram refused their media type",
+    ["file_type"],
+)
+SPOOL_BYTES = Gauge("tgupload_spool_bytes", "Bytes of downloads waiting to be uploaded", ["location"])
+
+class Stage:
+    """Times a stage and counts it as in flight while it runs.
+
+    Can be entered several times, the time of every run is added up.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.seconds = 0
+        self.started = None
+
+    def __enter__(self):
+        IN_FLIGHT.labels(self.stage).inc()
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds += time.monotonic() - self.started
+        IN_FLIGHT.labels(self.stage).dec()
+
+def observe_transfer(direction, size, seconds):
+    """Count transferred bytes and record the speed of the transfer"""
+    BYTES.labels(direction).inc(size)
+    if seconds > 0:
+        THROUGHPUT.labels(direction).observe(size / seconds / (1024 * 1024))
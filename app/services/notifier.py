@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import aiohttp
+
+from app.config import WEBHOOK_MAX_ATTEMPTS, WEBHOOK_TIMEOUT, WEBHOOK_RETRY_DELAY
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statuses after which a task never changes again
+FINAL_STATUSES = ("completed", "failed")
+
+class Subscription:
+    """Status changes of a set of tasks, as published by the workers"""
+
+    def __init__(self, notifier, task_ids):
+        self.notifier = notifier
+        self.task_ids = set(task_ids)
+        self.events = asyncio.Queue()
+
+    def __enter__(self):
+        for task_id in self.task_ids:
+            self.notifier.subscribers.setdefault(task_id, set()).add(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for task_id in self.task_ids:
+            subscribers = self.notifier.subscribers.get(task_id)
+            if subscribers:
+                subscribers.discard(self)
+                if not subscribers:
+                    del self.notifier.subscribers[task_id]
+
+    async def get(self, timeout=None):
+        """Wait for the next status change, or None on timeout"""
+        try:
+            return await asyncio.wait_for(self.events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class TaskNotifier:
+    """In-process fan-out of task status changes, plus webhook delivery"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.deliveries = set()
+        self.http_session = None
+
+    def subscribe(self, task_ids):
+        """Subscribe to status changes; use as a context manager"""
+        return Subscription(self, task_ids)
+
+    def publish(self, event):
+        """Hand a status change to everyone waiting for that task"""
+        for subscription in self.subscribers.get(event["id"], ()):
+            subscription.events.put_nowait(event)
+
+    def send_webhook(self, url, event):
+        """POST the event to url in the background, retrying on failure"""
+        delivery = asyncio.create_task(self._deliver(url, event))
+        # Keep a reference so the delivery isn't garbage collected midway
+        self.deliveries.add(delivery)
+        delivery.add_done_callback(self.deliveries.discard)
+
+    async def _deliver(self, url, event):
+        if not self.http_session or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT))
+
+        for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+            try:
+                async with self.http_session.post(url, json=event) as response:
+                    if response.status < 300:
+                        logger.debug(f"Webhook delivered: {event['id'][:8]}...")
+                        return
+                    error = f"HTTP {response.status}"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < WEBHOOK_MAX_ATTEMPTS:
+                delay = WEBHOOK_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning(f"Webhook attempt {attempt} failed for {event['id'][:8]}...: {error}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+        logger.error(f"Webhook gave up for {event['id'][:8]}... after {WEBHOOK_MAX_ATTEMPTS} attempts: {error}")
+
+    async def stop(self):
+        """Cancel pending deliveries and close the HTTP session"""
+        for delivery in list(self.deliveries):
+            delivery.cancel()
+        await asyncio.gather(*self.deliveries, return_exceptions=True)
+
+        if self.http_session:
+            await self.http_session.close()
+            self.http_session = None
+
+# Create a singleton instance
+task_notifier = TaskNotifier()
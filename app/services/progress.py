@@ -0,0 +1,135 @@
+import json
+import time
+import asyncio
+import logging
+
+from app.config import PROGRESS_SPEED_INTERVAL, PROGRESS_WRITE_INTERVAL
+from app.services.status_writer import status_writer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TaskProgress:
+    """Byte counts of a running task, updated by the transfer code"""
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.phase = "downloading"  # downloading, uploading or transferring (both at once)
+        self.downloaded = 0
+        self.uploaded = 0
+        self.total = None
+        self.speed = 0.0
+        self.sampled_at = time.monotonic()
+        self.sampled_bytes = 0
+
+    def set_phase(self, phase, total=None):
+        """Start a new phase, resetting the speed measurement"""
+        self.phase = phase
+        if total is not None:
+            self.total = total
+        self.speed = 0.0
+        self.sampled_at = time.monotonic()
+        self.sampled_bytes = self.current()
+
+    def set_downloaded(self, received):
+        """Record the bytes read from the source so far"""
+        self.downloaded = received
+        self._sample()
+
+    def set_uploaded(self, sent, total=None):
+        """Record the bytes sent to Telegram so far, as reported by Telethon"""
+        self.uploaded = sent
+        if total:
+            self.total = total
+        self._sample()
+
+    def current(self):
+        """Bytes done in the current phase"""
+        return self.uploaded if self.phase == "uploading" else self.downloaded
+
+    def _sample(self):
+        # Called for every chunk, so only recompute the speed now and then
+        now = time.monotonic()
+        elapsed = now - self.sampled_at
+        if elapsed < PROGRESS_SPEED_INTERVAL:
+            return
+
+        done = self.current()
+        self.speed = (done - self.sampled_bytes) / elapsed
+        self.sampled_at = now
+        self.sampled_bytes = done
+
+    def get_info(self):
+        """Get the progress as a dict for the API"""
+        eta = None
+        if self.total and self.speed > 0:
+            eta = max(self.total - self.current(), 0) / self.speed
+
+        return {
+            "phase": self.phase,
+            "downloaded_bytes": self.downloaded,
+            "uploaded_bytes": self.uploaded,
+            "total_bytes": self.total,
+            "speed": self.speed,
+            "eta": eta,
+        }
+
+class ProgressTracker:
+    """In-memory progress of the tasks this process is working on.
+
+    An API process without uploads can't see it, so uploader processes
+    also write it to the tasks every PROGRESS_WRITE_INTERVAL seconds.
+    """
+
+    def __init__(self, write_interval=PROGRESS_WRITE_INTERVAL):
+        self.tasks = {}
+        self.write_interval = write_interval
+        self.writer = None
+        self.writes = 0
+
+    def start(self, task_id):
+        """Start tracking a task"""
+        progress = self.tasks[task_id] = TaskProgress(task_id)
+        return progress
+
+    def finish(self, task_id):
+        """Stop tracking a task"""
+        self.tasks.pop(task_id, None)
+
+    def get_info(self, task_id):
+        """Get the progress of a task, or None if it isn't running here"""
+        progress = self.tasks.get(task_id)
+        return progress.get_info() if progress else None
+
+    async def start_writing(self):
+        """Start writing the progress of running tasks to the database"""
+        if self.writer or self.write_interval <= 0:
+            return
+
+        self.writer = asyncio.create_task(self._write())
+
+    async def stop_writing(self):
+        """Stop writing progress"""
+        if not self.writer:
+            return
+
+        self.writer.cancel()
+        await asyncio.gather(self.writer, return_exceptions=True)
+        self.writer = None
+
+    async def _write(self):
+        while True:
+            await asyncio.sleep(self.write_interval)
+            try:
+                # Queued together, so they are written in one transaction. Only
+                # running tasks are updated, a finished one keeps its final row.
+                await asyncio.gather(*(
+                    status_writer.update(task_id, {"progress": json.dumps(progress.get_info())}, status="processing")
+                    for task_id, progress in list(self.tasks.items())
+                ))
+                self.writes += 1
+            except Exception as e:
+                logger.error(f"Failed to write task progress: {str(e)}")
+
+# Create a singleton instance
+task_progress = ProgressTracker()
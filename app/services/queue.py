@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, or_
+
+from app.config import QUEUE_WORKERS, QUEUE_MAX_SIZE, QUEUE_POLL_INTERVAL, WORKER_ID, TASK_LEASE_SECONDS
+from app.database.setup import SessionLocal
+from app.models.task import Task
+from app.services.status_writer import status_writer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TaskQueue:
+    """Job queue backed by the tasks table.
+
+    Pending rows are the source of truth: the in-memory queue only wakes up
+    workers quickly, and a feeder refills it from the database so nothing is
+    lost when it is full or the process restarts. Claimed tasks are leased:
+    the claims of running tasks are renewed, and tasks whose claim expired
+    are put back to pending for any uploader to take over.
+    """
+
+    def __init__(self):
+        self.handler = None
+        self.queue = None
+        self.queued = set()
+        self.workers = []
+        self.feeder = None
+        self.lease_keeper = None
+        self.claimed = set()  # Tasks the workers of this process are working on
+        self.busy = 0
+        self.recovered = 0
+
+    async def start(self, handler):
+        """Recover orphaned tasks and start the workers"""
+        if self.workers:
+            logger.info("Task queue already started")
+            return
+
+        self.handler = handler
+        self.queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+
+        await self.recover(startup=True)
+
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(QUEUE_WORKERS)]
+        self.feeder = asyncio.create_task(self._feeder())
+        self.lease_keeper = asyncio.create_task(self._keep_leases())
+        logger.info(f"Task queue started with {QUEUE_WORKERS} workers")
+
+    async def stop(self):
+        """Stop the workers, leaving unfinished tasks to be recovered"""
+        for worker in self.workers + [self.feeder, self.lease_keeper]:
+            if worker:
+                worker.cancel()
+        await asyncio.gather(*self.workers, self.feeder, self.lease_keeper, return_exceptions=True)
+
+        self.workers = []
+        self.feeder = None
+        self.lease_keeper = None
+        logger.info("Task queue stopped")
+
+    async def recover(self, startup=False):
+        """Put tasks whose uploader stopped renewing its claim back to pending.
+
+        At startup, tasks claimed under this worker ID were left by a
+        previous run with the same ID, and are taken back right away.
+        """
+        expired = datetime.utcnow() - timedelta(seconds=TASK_LEASE_SECONDS)
+        orphaned = or_(Task.claimed_at.is_(None), Task.claimed_at < expired)
+        if startup:
+            orphaned = or_(orphaned, Task.worker_id == WORKER_ID)
+
+        async with SessionLocal() as db:
+            result = await db.execute(
+                update(Task).where(Task.status == "processing", orphaned).values(status="pending", worker_id=None)
+            )
+            await db.commit()
+
+        if result.rowcount:
+            self.recovered += result.rowcount
+            logger.info(f"Recovered {result.rowcount} interrupted tasks")
+        return result.rowcount
+
+    async def renew_claims(self):
+        """Keep the claims of the tasks this uploader is working on from expiring.
+
+        Only tasks a worker still holds are renewed. A task left processing,
+        say because its final status couldn't be written, expires and is
+        recovered.
+        """
+        # Queued together, so they are written in one transaction
+        now = datetime.utcnow()
+        await asyncio.gather(*(
+            status_writer.update(task_id, {"claimed_at": now}, status="processing") for task_id in list(self.claimed)
+        ))
+
+    def is_full(self):
+        """Whether new tasks should be rejected until the backlog drains"""
+        return self.queue is not None and self.queue.full()
+
+    def enqueue(self, task_id):
+        """Hand a pending task to the workers.
+
+        If the queue is full the task stays pending in the database and the
+        feeder picks it up later.
+        """
+        if self.queue is None or task_id in self.queued:
+            return False
+        try:
+            self.queue.put_nowait(task_id)
+        except asyncio.QueueFull:
+            return False
+        self.queued.add(task_id)
+        return True
+
+    async def claim(self, task_id):
+        """Atomically move a task from pending to processing.
+
+        The claim is renewed until the task is released.
+        """
+        values = {"status": "processing", "worker_id": WORKER_ID, "claimed_at": datetime.utcnow(), "progress": None}
+        claimed = await status_writer.update(task_id, values, status="pending")
+        if claimed:
+            self.claimed.add(task_id)
+        return claimed
+
+    def release(self, *task_ids):
+        """Stop renewing the claims of tasks that are done with"""
+        self.claimed.difference_update(task_ids)
+
+    async def _pending_ids(self, limit):
+        """Get the oldest pending task IDs.
+
+        Album members are left out, they are processed with their first task.
+        """
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(Task.id)
+                .where(Task.status == "pending")
+                .where(or_(Task.album_id.is_(None), Task.album_id == Task.id))
+                .order_by(Task.created_at)
+                .limit(limit + len(self.queued))
+            )
+            return list(result.scalars())
+
+    async def _feeder(self):
+        """Periodically move pending rows from the database into the queue"""
+        while True:
+            try:
+                free = self.queue.maxsize - self.queue.qsize()
+                if free > 0:
+                    for task_id in await self._pending_ids(free):
+                        self.enqueue(task_id)
+            except Exception as e:
+                logger.error(f"Failed to load pending tasks: {str(e)}")
+
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+    async def _keep_leases(self):
+        """Renew this uploader's claims and take over expired ones of others"""
+        while True:
+            # Several renewals fit into a lease, so one failed write doesn't lose it
+            await asyncio.sleep(TASK_LEASE_SECONDS / 4)
+            try:
+                await self.renew_claims()
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Failed to renew task claims: {str(e)}")
+
+    async def _worker(self):
+        """Claim and process tasks one at a time"""
+        while True:
+            task_id = await self.queue.get()
+            self.queued.discard(task_id)
+
+            try:
+                # Another worker may have claimed it already
+                if not await self.claim(task_id):
+                    continue
+
+                self.busy += 1
+                try:
+                    await self.handler(task_id)
+                finally:
+                    self.busy -= 1
+                    self.release(task_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker failed on {task_id[:8]}...: {str(e)}")
+
+    def get_stats(self):
+        """Get queue statistics"""
+        return {
+            "workers": len(self.workers),
+            "busy": self.busy,
+            "claimed": len(self.claimed),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "max_queued": QUEUE_MAX_SIZE,
+            "recovered": self.recovered,
+        }
+
+# Create a singleton instance
+task_queue = TaskQueue()
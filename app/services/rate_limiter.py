@@ -0,0 +1,87 @@
+import time
+import asyncio
+import logging
+
+from app.config import SEND_RATE, SEND_BURST, SEND_RATE_MIN, SEND_RATE_STEP, SEND_RATE_DECREASE
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Token bucket for the messages sent by one client, adapted to FloodWaits.
+
+    A FloodWait pauses the bucket for the time Telegram asked for, so every
+    task using the client waits, not only the one that got the error. The
+    rate is also cut on every FloodWait and grows back a little with every
+    message sent without one (AIMD), settling just below what Telegram
+    tolerates for the account.
+    """
+
+    def __init__(self, rate=SEND_RATE, burst=SEND_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.flood_waits = 0
+        self.last_flood_wait = None
+
+    def pause_remaining(self):
+        """Seconds until the client may send again after a FloodWait"""
+        return max(0, self.paused_until - time.monotonic())
+
+    async def wait_for_pause(self):
+        """Wait until a FloodWait pause of the client is over, without taking a token"""
+        remaining = self.pause_remaining()
+        while remaining:
+            await asyncio.sleep(remaining)
+            remaining = self.pause_remaining()
+
+    async def acquire(self):
+        """Wait until the client may send a message"""
+        while True:
+            await self.wait_for_pause()
+
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        """Raise the rate slowly while Telegram accepts messages"""
+        self.rate = min(self.max_rate, self.rate + SEND_RATE_STEP)
+
+    def on_flood_wait(self, error):
+        """Pause the client and cut the rate after a FloodWaitError"""
+        # The same error is seen again by the callers it is raised through
+        if getattr(error, "rate_limited", False):
+            return
+        error.rate_limited = True
+
+        metrics.FLOOD_WAIT_SECONDS.observe(error.seconds)
+        self.flood_waits += 1
+        self.last_flood_wait = error.seconds
+
+        # Errors of requests sent before the pause started don't cut the rate again
+        if not self.pause_remaining():
+            self.rate = max(SEND_RATE_MIN, self.rate * SEND_RATE_DECREASE)
+        self.paused_until = max(self.paused_until, time.monotonic() + error.seconds)
+        self.tokens = 0
+        logger.warning(f"FloodWait of {error.seconds}s, sending at most {self.rate:.2f} messages/s")
+
+    def get_stats(self):
+        """Get the current rate and pause state"""
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "tokens": round(min(self.burst, self.tokens), 2),
+            "paused_for": round(self.pause_remaining()),
+            "flood_waits": self.flood_waits,
+            "last_flood_wait": self.last_flood_wait,
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete
+
+from app.config import RETENTION_DAYS, RETENTION_ARCHIVE, RETENTION_BATCH_SIZE, RETENTION_INTERVAL
+from app.database.setup import SessionLocal
+from app.models.task import Task, TaskArchive
+from app.services.notifier import FINAL_STATUSES
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TaskRetention:
+    """Periodically archives or deletes old finished tasks.
+
+    Rows are removed in small batches, each in its own transaction, so the
+    job never holds the write lock for long.
+    """
+
+    def __init__(self):
+        self.job = None
+        self.archived = 0
+        self.deleted = 0
+        self.last_run = None
+
+    async def start(self):
+        """Start the retention job, if a retention age is configured"""
+        if self.job or RETENTION_DAYS <= 0:
+            return
+
+        self.job = asyncio.create_task(self._run())
+        logger.info(f"Retention job started, keeping tasks for {RETENTION_DAYS:g} days")
+
+    async def stop(self):
+        """Stop the retention job"""
+        if not self.job:
+            return
+
+        self.job.cancel()
+        await asyncio.gather(self.job, return_exceptions=True)
+        self.job = None
+
+    async def _run(self):
+        while True:
+            try:
+                removed = await self.run_once()
+                if removed:
+                    logger.info(f"Retention removed {removed} tasks")
+            except Exception as e:
+                logger.error(f"Retention run failed: {str(e)}")
+
+            await asyncio.sleep(RETENTION_INTERVAL)
+
+    async def run_once(self, days=RETENTION_DAYS, archive=RETENTION_ARCHIVE):
+        """Remove finished tasks older than days, returns how many"""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        removed = 0
+        while True:
+            count = await self._remove_batch(cutoff, archive)
+            removed += count
+            if count < RETENTION_BATCH_SIZE:
+                break
+            # Let other writers in between batches
+            await asyncio.sleep(0)
+
+        self.last_run = datetime.utcnow()
+        return removed
+
+    async def _remove_batch(self, cutoff, archive):
+        """Archive or delete one batch of tasks in a transaction"""
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(Task.id)
+                .where(Task.status.in_(FINAL_STATUSES), Task.created_at < cutoff)
+                .limit(RETENTION_BATCH_SIZE)
+            )
+            task_ids = list(result.scalars())
+            if not task_ids:
+                return 0
+
+            if archive:
+                # archived_at is filled in by its column default
+                columns = Task.__table__.columns
+                await db.execute(
+                    insert(TaskArchive).from_select(
+                        [column.name for column in columns],
+                        select(*columns).where(Task.id.in_(task_ids)),
+                    )
+                )
+            await db.execute(delete(Task).where(Task.id.in_(task_ids)))
+            await db.commit()
+
+        if archive:
+            self.archived += len(task_ids)
+        else:
+            self.deleted += len(task_ids)
+        return len(task_ids)
+
+    def get_stats(self):
+        """Get retention statistics"""
+        return {
+            "enabled": RETENTION_DAYS > 0,
+            "archived": self.archived,
+            "deleted": self.deleted,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+# Create a singleton instance
+task_retention = TaskRetention()
@@ -0,0 +1,63 @@
+import random
+import asyncio
+import logging
+import aiohttp
+from telethon.errors import ServerError, TimedOutError
+
+from app.config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_HTTP_STATUSES
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Errors that say nothing about the file itself, so trying again can work
+RETRYABLE_ERRORS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+    ConnectionError,
+    ServerError,
+    TimedOutError,
+)
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient errors"""
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY, retry_statuses=RETRY_HTTP_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+
+    def is_retryable(self, error):
+        """Whether the error is worth another attempt"""
+        # HTTP errors only when the status says the server may recover
+        status = getattr(error, "status", None)
+        if status is not None:
+            return status in self.retry_statuses
+        return isinstance(error, RETRYABLE_ERRORS)
+
+    def get_delay(self, attempt):
+        """Seconds to wait after the given failed attempt"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # Half fixed, half random, so clients failing together don't retry together
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def backoff(self, attempt, error, operation):
+        """Wait before the next attempt, or return False if the error should be raised"""
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return False
+
+        delay = self.get_delay(attempt)
+        metrics.RETRIES.labels(operation).inc()
+        logger.warning(
+            f"{operation.capitalize()} attempt {attempt} failed: {str(error) or type(error).__name__}, "
+            f"retrying in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+        return True
+
+# Create a singleton instance
+retry_policy = RetryPolicy()
@@ -0,0 +1,180 @@
+import os
+import struct
+
+# Bytes kept from the start of every file. JPEG dimensions follow the EXIF
+# block, which can be up to 64KB.
+SNIFF_SIZE = 64 * 1024
+
+# Formats Telegram turns into photos, others of the photo family (GIF, WebP)
+# are sent as documents and shown as animations or stickers
+PHOTO_FORMATS = {"jpeg", "png"}
+
+# Telegram's limits for photos, bigger ones are refused with PHOTO_INVALID_DIMENSIONS
+PHOTO_MAX_SIZE = 10 * 1024 * 1024
+PHOTO_MAX_DIMENSIONS = 10000  # Width and height together
+PHOTO_MAX_RATIO = 20  # Longer side divided by the shorter one
+
+class Content:
+    """What the first bytes of a file say it is"""
+
+    def __init__(self, format, file_type, extensions, width=None, height=None):
+        self.format = format  # Container, e.g. jpeg, mp4 or pdf
+        self.file_type = file_type  # photo, video, audio or document
+        self.extensions = extensions  # The first one is used to rename the file
+        self.width = width
+        self.height = height
+
+    def __repr__(self):
+        return f"Content({self.format}, {self.file_type})"
+
+def sniff(head):
+    """Detect the format of a file from its first bytes, None if unknown"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return Content("jpeg", "photo", (".jpg", ".jpeg"), *_get_jpeg_size(head))
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24:
+        width, height = struct.unpack(">II", head[16:24])
+        return Content("png", "photo", (".png",), width, height)
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        width, height = struct.unpack("<HH", head[6:10])
+        return Content("gif", "photo", (".gif",), width, height)
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return Content("webp", "photo", (".webp",), *_get_webp_size(head))
+
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"qt  ":
+            return Content("mov", "video", (".mov",))
+        if brand in (b"M4A ", b"M4B "):
+            return Content("m4a", "audio", (".m4a", ".m4b"))
+        if brand in (b"heic", b"heix", b"mif1", b"msf1", b"avif"):
+            return Content("heif", "document", (".heic", ".avif"))
+        return Content("mp4", "video", (".mp4", ".m4v"))
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        # Matroska and WebM only differ by the DocType in the EBML header
+        if b"webm" in head[:64]:
+            return Content("webm", "video", (".webm",))
+        return Content("mkv", "video", (".mkv",))
+    if head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+        return Content("avi", "video", (".avi",))
+    if head.startswith(b"\x30\x26\xb2\x75\x8e\x66\xcf\x11"):
+        return Content("wmv", "video", (".wmv", ".asf"))
+    if head.startswith(b"FLV\x01"):
+        return Content("flv", "video", (".flv",))
+
+    if head.startswith(b"OggS"):
+        if b"theora" in head[:64]:
+            return Content("ogv", "video", (".ogv",))
+        return Content("ogg", "audio", (".ogg", ".oga", ".opus"))
+    if head.startswith(b"fLaC"):
+        return Content("flac", "audio", (".flac",))
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return Content("wav", "audio", (".wav",))
+    if head.startswith(b"ID3"):
+        return Content("mp3", "audio", (".mp3",))
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return Content("aac", "audio", (".aac",))
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return Content("mp3", "audio", (".mp3",))
+
+    if head.startswith(b"%PDF-"):
+        return Content("pdf", "document", (".pdf",))
+    if head.startswith(b"PK\x03\x04"):
+        return Content("zip", "document", (".zip",))
+    # Error pages served with a 200 instead of the file
+    if head[:512].lstrip().lower().startswith((b"<!doctype html", b"<html")):
+        return Content("html", "document", (".html",))
+    return None
+
+def get_photo_problem(content, size):
+    """Get the reason Telegram would refuse a file as a photo, or None"""
+    if content.format not in PHOTO_FORMATS:
+        return None
+    if size > PHOTO_MAX_SIZE:
+        return f"{size} bytes is above the photo limit of {PHOTO_MAX_SIZE}"
+    if not content.width or not content.height:
+        return "image dimensions not found"
+    if content.width + content.height > PHOTO_MAX_DIMENSIONS:
+        return f"{content.width}x{content.height} is above the photo limit of {PHOTO_MAX_DIMENSIONS} pixels"
+    if max(content.width, content.height) / min(content.width, content.height) > PHOTO_MAX_RATIO:
+        return f"{content.width}x{content.height} is wider than a 1:{PHOTO_MAX_RATIO} ratio"
+    return None
+
+def choose_file_type(guessed, content, size):
+    """Decide how to send a file from the type guessed by its name and its content.
+
+    Returns (file_type, reason), with the reason the guess was overruled or None.
+    """
+    if content is None:
+        # Sending anything but an image as a photo fails, other types are left to the guess
+        if guessed == "photo":
+            return "document", "content is not a known image format"
+        return guessed, None
+
+    if content.file_type == "photo":
+        if content.format not in PHOTO_FORMATS:
+            if guessed == "document":
+                return guessed, None
+            return "document", f"content is {content.format}, which Telegram keeps as a document"
+        problem = get_photo_problem(content, size)
+        if problem:
+            return "document", problem
+
+    if content.file_type != guessed:
+        return content.file_type, f"content is {content.format}"
+    return guessed, None
+
+def is_document_image(content):
+    """Whether the content is an image Telegram keeps as a document, like GIF or WebP"""
+    return content is not None and content.file_type == "photo" and content.format not in PHOTO_FORMATS
+
+def is_album_photo(content, size):
+    """Whether a file can go into an album as a photo"""
+    return content is not None and content.format in PHOTO_FORMATS and not get_photo_problem(content, size)
+
+def fix_extension(filename, content, file_type):
+    """Give a file sent as media the extension of its content.
+
+    Telethon chooses between photo, video and audio from the extension, so
+    image.php holding a JPEG is renamed image.jpg.
+    """
+    if content is None or file_type != content.file_type or file_type == "document":
+        return filename
+
+    name, ext = os.path.splitext(filename)
+    if ext.lower() in content.extensions:
+        return filename
+    return name + content.extensions[0]
+
+def read_head(path):
+    """Read the bytes to sniff from the start of a file"""
+    with open(path, "rb") as f:
+        return f.read(SNIFF_SIZE)
+
+def _get_jpeg_size(head):
+    # Walk the segments up to the start of frame, which holds the dimensions
+    position = 2
+    while position + 9 <= len(head):
+        if head[position] != 0xFF:
+            break
+        marker = head[position + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            position += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", head[position + 5:position + 9])
+            return width, height
+        position += 2 + struct.unpack(">H", head[position + 2:position + 4])[0]
+    return None, None
+
+def _get_webp_size(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None, None
@@ -0,0 +1,229 @@
+import os
+import re
+import fcntl
+import asyncio
+import logging
+import tempfile
+
+from app.config import SPOOL_DIR, SPOOL_MAX_SIZE, SPOOL_MEMORY_THRESHOLD, WORKER_ID
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SpoolFile:
+    """A downloaded file waiting in the spool to be uploaded.
+
+    Kept in memory while it is below the memory threshold and moved to a
+    file in the spool directory once it grows past it. Write to it inside
+    a with block, which keeps the file on disk open.
+    """
+
+    def __init__(self, manager, suffix="", in_memory=True):
+        self.manager = manager
+        self.suffix = suffix
+        self.data = bytearray() if in_memory else None
+        self.path = None
+        self.size = 0
+        self.disk_size = 0  # Bytes counted against the spool's disk budget
+        self._file = None
+
+    def __enter__(self):
+        if self.path:
+            self._file = open(self.path, "ab")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def write(self, chunk):
+        """Append chunk to the file"""
+        if self.data is not None and len(self.data) + len(chunk) > self.manager.memory_threshold:
+            self._spill()
+
+        if self.data is not None:
+            self.data += chunk
+            self.manager._account(memory=len(chunk))
+        else:
+            self._file.write(chunk)
+            self.disk_size += len(chunk)
+            self.manager._account(disk=len(chunk))
+        self.size += len(chunk)
+
+    def _spill(self):
+        # Too big for memory, continue on disk with what was received so far
+        self.path = self.manager._create_path(self.suffix)
+        self._file = open(self.path, "ab")
+        self._file.write(self.data)
+        self.disk_size = len(self.data)
+        self.manager._account(disk=len(self.data), memory=-len(self.data))
+        self.data = None
+
+    def getvalue(self):
+        """Get the content of a file kept in memory"""
+        return bytes(self.data)
+
+    def remove(self):
+        """Delete the file and give its space back to the spool"""
+        self.manager.release(self)
+
+class SpoolManager:
+    """Downloaded files waiting to be uploaded, with a budget for disk space.
+
+    Every file lives in a directory of this worker's own, locked while the
+    process runs. Directories whose lock is free belong to processes that
+    stopped, so files left by a crash are removed at the next start without
+    touching the files of running processes. New downloads wait while the
+    files on disk add up to more than the budget.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, max_size=SPOOL_MAX_SIZE, memory_threshold=SPOOL_MEMORY_THRESHOLD):
+        self.root = directory
+        # Worker IDs contain the host name, keep them to safe characters
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]", "_", WORKER_ID))
+        self.max_size = max_size
+        self.memory_threshold = memory_threshold
+        self.disk_used = 0
+        self.memory_used = 0
+        self.files = 0
+        self.waits = 0
+        self.swept = 0
+        self.freed = None
+        self._lock = None
+
+    def start(self):
+        """Create the spool directory and remove files left by stopped processes"""
+        if self.freed:
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = _lock(self.directory)
+        if self._lock is None:
+            raise RuntimeError(f"Spool {self.directory} is used by another process, WORKER_ID must be unique")
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.freed = asyncio.Event()
+        self.swept = self.sweep()
+        if self.swept:
+            logger.warning(f"Removed {self.swept} orphaned files from the spool")
+
+    def sweep(self):
+        """Delete the files of this and of stopped processes, returns how many"""
+        removed = _empty(self.directory)
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if directory == self.directory or not os.path.isdir(directory):
+                continue
+
+            lock = _lock(directory)
+            if lock is None:
+                # Its process is still running
+                continue
+            try:
+                removed += _empty(directory)
+                os.rmdir(directory)
+                os.unlink(directory + ".lock")
+            except OSError as e:
+                logger.warning(f"Failed to delete orphaned spool directory {name}: {str(e)}")
+            finally:
+                os.close(lock)
+        return removed
+
+    def new_file(self, suffix="", in_memory=True, size=None):
+        """Start a file in the spool.
+
+        With size, the file is created on disk right away at that size, for
+        writing its parts at their offsets.
+        """
+        spool_file = SpoolFile(self, suffix, in_memory and size is None)
+        if spool_file.data is None:
+            spool_file.path = self._create_path(suffix)
+        if size is not None:
+            os.truncate(spool_file.path, size)
+            spool_file.size = spool_file.disk_size = size
+            self._account(disk=size)
+        return spool_file
+
+    async def wait_for_space(self):
+        """Wait until the files on disk are within the budget"""
+        if self.disk_used < self.max_size:
+            return
+
+        self.waits += 1
+        logger.warning(f"Spool full ({self.disk_used} of {self.max_size} bytes), waiting for uploads to finish")
+        while self.disk_used >= self.max_size:
+            await self.freed.wait()
+
+    def release(self, spool_file):
+        """Delete a file and give its space back"""
+        if spool_file.path:
+            try:
+                os.unlink(spool_file.path)
+            except OSError as e:
+                logger.warning(f"Failed to delete temporary file: {str(e)}")
+            self.files -= 1
+            spool_file.path = None
+        self._account(disk=-spool_file.disk_size, memory=-len(spool_file.data or b""))
+        spool_file.disk_size = 0
+        spool_file.data = None
+
+        # Wake up the downloads waiting for space, they check again
+        if self.freed:
+            self.freed.set()
+            self.freed = asyncio.Event()
+
+    def _create_path(self, suffix):
+        self.start()
+        fd, path = tempfile.mkstemp(suffix=suffix or "", dir=self.directory)
+        os.close(fd)
+        self.files += 1
+        return path
+
+    def _account(self, disk=0, memory=0):
+        self.disk_used += disk
+        self.memory_used += memory
+        metrics.SPOOL_BYTES.labels("disk").set(self.disk_used)
+        metrics.SPOOL_BYTES.labels("memory").set(self.memory_used)
+
+    def get_stats(self):
+        """Get spool usage"""
+        return {
+            "directory": self.directory,
+            "files": self.files,
+            "disk_bytes": self.disk_used,
+            "max_disk_bytes": self.max_size,
+            "memory_bytes": self.memory_used,
+            "memory_threshold": self.memory_threshold,
+            "waits": self.waits,
+            "orphans_removed": self.swept,
+        }
+
+def _lock(directory):
+    """Lock a spool directory for this process, None if another process holds it.
+
+    The lock file sits next to the directory, so the directory can be
+    removed while it is held. The lock is released when the process ends.
+    """
+    fd = os.open(directory + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+def _empty(directory):
+    """Delete every file in a directory, returns how many"""
+    removed = 0
+    for name in os.listdir(directory):
+        try:
+            os.unlink(os.path.join(directory, name))
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Failed to delete orphaned spool file {name}: {str(e)}")
+    return removed
+
+# Create a singleton instance
+spool_manager = SpoolManager()
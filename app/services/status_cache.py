@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+
+from app.config import STATUS_CACHE_SIZE, STATUS_CACHE_TTL, RUN_UPLOADER
+from app.services.notifier import FINAL_STATUSES
+
+class TaskStatusCache:
+    """LRU cache of task statuses, kept up to date by the workers.
+
+    Entries expire after a while, so a change the workers didn't report is
+    eventually read from the database. Without workers in this process,
+    nothing reports changes, so only final statuses are cached.
+    """
+
+    def __init__(self, max_size=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL, final_only=not RUN_UPLOADER):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.final_only = final_only
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task_id):
+        """Get the cached status of a task, or None"""
+        entry = self.entries.get(task_id)
+        if entry and entry[0] < time.monotonic():
+            del self.entries[task_id]
+            entry = None
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(task_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, task):
+        """Store the status of a task, given as a FileResponse dict"""
+        if self.max_size <= 0 or self.final_only and task["status"] not in FINAL_STATUSES:
+            return
+
+        self.entries[task["id"]] = (time.monotonic() + self.ttl, task)
+        self.entries.move_to_end(task["id"])
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def fill(self, task):
+        """Store a status read from the database and return the status to use.
+
+        A worker may report a change while the row is being read, so a
+        cached status is kept and returned instead of the older row.
+        """
+        entry = self.entries.get(task["id"])
+        if entry and entry[0] >= time.monotonic():
+            return entry[1]
+
+        self.put(task)
+        return task
+
+    def get_stats(self):
+        """Get cache statistics"""
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+# Create a singleton instance
+task_cache = TaskStatusCache()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from sqlalchemy import select
+
+from app.config import STATUS_POLL_INTERVAL
+from app.database.setup import SessionLocal
+from app.models.task import Task
+from app.models.schemas import FileResponse
+from app.services.notifier import task_notifier
+from app.services.status_cache import task_cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Task IDs per SELECT ... IN query
+POLL_BATCH_SIZE = 500
+
+class StatusPoller:
+    """Reads status changes made by uploader processes for local subscribers.
+
+    Workers in another process can't publish to the notifier of this one,
+    so the tasks somebody waits for (long polls and event streams) are
+    read from the database every STATUS_POLL_INTERVAL seconds instead, and
+    changed statuses are published as if a local worker had sent them.
+    """
+
+    def __init__(self, interval=STATUS_POLL_INTERVAL):
+        self.interval = interval
+        self.poller = None
+        self.statuses = {}
+        self.polls = 0
+        self.published = 0
+
+    async def start(self):
+        """Start polling"""
+        if self.poller:
+            return
+
+        self.poller = asyncio.create_task(self._run())
+        logger.info(f"Status poller started, reading every {self.interval:g}s")
+
+    async def stop(self):
+        """Stop polling"""
+        if not self.poller:
+            return
+
+        self.poller.cancel()
+        await asyncio.gather(self.poller, return_exceptions=True)
+        self.poller = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Failed to poll task statuses: {str(e)}")
+
+            await asyncio.sleep(self.interval)
+
+    async def poll(self):
+        """Publish the tasks with subscribers whose status changed since the last poll"""
+        task_ids = list(task_notifier.subscribers)
+        # Forget tasks nobody waits for anymore
+        self.statuses = {task_id: self.statuses[task_id] for task_id in task_ids if task_id in self.statuses}
+        if not task_ids:
+            return
+
+        self.polls += 1
+        async with SessionLocal() as db:
+            for start in range(0, len(task_ids), POLL_BATCH_SIZE):
+                result = await db.execute(select(Task).where(Task.id.in_(task_ids[start:start + POLL_BATCH_SIZE])))
+                for task in result.scalars():
+                    # A subscriber may have read the task before it changed, so
+                    # the first status seen is published too
+                    if self.statuses.get(task.id) == task.status:
+                        continue
+
+                    self.statuses[task.id] = task.status
+                    event = FileResponse.model_validate(task).dict()
+                    task_cache.put(event)
+                    task_notifier.publish(event)
+                    self.published += 1
+
+    def get_stats(self):
+        """Get poller statistics"""
+        return {
+            "interval": self.interval,
+            "watched": len(self.statuses),
+            "polls": self.polls,
+            "published": self.published,
+        }
+
+# Create a singleton instance
+status_poller = StatusPoller()
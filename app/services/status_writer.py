@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from sqlalchemy import update
+
+from app.config import STATUS_FLUSH_INTERVAL, STATUS_BATCH_SIZE
+from app.database.setup import SessionLocal
+from app.models.task import Task
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class StatusWriter:
+    """Single writer for task status updates.
+
+    SQLite lets one transaction write at a time, so workers committing on
+    their own keep fighting over the lock. Instead they queue their updates
+    here and one coroutine writes whatever arrived within a few milliseconds
+    in a single transaction.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.writer = None
+        self.batches = 0
+        self.updates = 0
+
+    async def start(self):
+        """Start the writer coroutine"""
+        if self.writer:
+            return
+
+        self.queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self._run())
+        logger.info("Status writer started")
+
+    async def stop(self):
+        """Write the queued updates and stop"""
+        if not self.writer:
+            return
+
+        self.queue.put_nowait(None)
+        await self.writer
+        self.writer = None
+        logger.info("Status writer stopped")
+
+    async def update(self, task_id, values, status=None):
+        """Update a task and wait until the change is committed.
+
+        With status, the update only applies while the task still has that
+        status. Returns whether the task was updated.
+        """
+        # Write directly when the writer isn't running, e.g. during shutdown
+        if not self.writer:
+            return (await self._write([(task_id, values, status)]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((task_id, values, status, future))
+        return await future
+
+    async def _run(self):
+        """Collect queued updates and write them in batches"""
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            if batch[0] is not None:
+                # Give the other workers a moment to join this transaction
+                await asyncio.sleep(STATUS_FLUSH_INTERVAL)
+            while len(batch) < STATUS_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            stopping = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        """Write a batch and hand the results to the waiting workers"""
+        try:
+            results = await self._write([item[:3] for item in batch])
+        except Exception as e:
+            # Don't let one bad update fail the others, retry them one by one
+            logger.warning(f"Batched status write of {len(batch)} updates failed: {str(e)}")
+            results = []
+            for item in batch:
+                try:
+                    results.extend(await self._write([item[:3]]))
+                except Exception as e:
+                    results.append(e)
+
+        for (_, _, _, future), result in zip(batch, results):
+            # The worker may have been cancelled while waiting
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _write(self, updates):
+        """Apply updates in one transaction"""
+        async with SessionLocal() as db:
+            results = []
+            for task_id, values, status in updates:
+                statement = update(Task).where(Task.id == task_id)
+                if status:
+                    statement = statement.where(Task.status == status)
+                result = await db.execute(statement.values(**values))
+                results.append(result.rowcount == 1)
+            await db.commit()
+
+        self.batches += 1
+        self.updates += len(updates)
+        return results
+
+    def get_stats(self):
+        """Get writer statistics"""
+        return {
+            "batches": self.batches,
+            "updates": self.updates,
+            "queued": self.queue.qsize() if self.queue else 0,
+        }
+
+# Create a singleton instance
+status_writer = StatusWriter()
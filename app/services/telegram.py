@@ -1,32 +1,92 @@
 import os
+import time
+import hashlib
+import asyncio
 import logging
 import aiohttp
-import tempfile
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError, FilePartMissingError, FilePart0MissingError, FilePartsInvalidError
+from telethon.helpers import generate_random_long
+from telethon.network import MTProtoSender
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import (
+    InputFileBig, InputDocument, InputPhoto,
+    DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeImageSize,
+    PhotoSize, PhotoSizeProgressive,
+)
 
-from app.config import TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE, PRIVATE_CHANNEL_ID
+from app.config import (
+    TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_SESSIONS, TELEGRAM_SESSION_FILE, PRIVATE_CHANNEL_ID,
+    DOWNLOAD_CHUNK_SIZE, MAX_DOWNLOAD_SIZE, PIPELINE_UPLOADS, DOWNLOAD_SEGMENTS, SEGMENTED_DOWNLOAD_SIZE,
+    HTTP_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_DNS_TTL, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+    MAX_CONCURRENT_DOWNLOADS, MAX_CONCURRENT_UPLOADS,
+    UPLOAD_WORKERS, UPLOAD_PART_SIZE_KB, UPLOAD_MAX_PARTS, DEDUP_ENABLED, FLOOD_WAIT_MAX,
+)
+from app.services import dedup, metrics, sniffer
+from app.services.rate_limiter import RateLimiter
+from app.services.retry import retry_policy
+from app.services.spool import spool_manager
+from app.services.metadata import metadata_extractor
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Define session path within the data directory
-SESSION_FILE_PATH = os.path.join("data", "tg_session")
+SESSION_FILE_PATH = TELEGRAM_SESSION_FILE
+
+# Telegram only accepts files above this size as big files uploaded in parts
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+# The parts of an uploaded handle are gone or incomplete, the bytes have to be sent again
+EXPIRED_UPLOAD_ERRORS = (FilePartMissingError, FilePart0MissingError, FilePartsInvalidError)
+
+class ClientSlot:
+    """A client in the pool together with its current load"""
+    
+    def __init__(self, name, client, me=None):
+        self.name = name
+        self.client = client
+        self.me = me
+        self.in_flight = 0
+        self.uploads = 0
+        self.limiter = RateLimiter()
+    
+    def flood_wait_remaining(self):
+        """Seconds until Telegram accepts uploads from this client again"""
+        return self.limiter.pause_remaining()
 
 class TelegramService:
     def __init__(self):
-        self.client = None
-        self.me = None
+        self.clients = []
         self.channel_validated = False
+        self.http_session = None
+        self.download_slots = None
+        self.upload_slots = None
+        self.http_stats = {
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
     
     async def start(self):
         """Initialize and start the Telegram client"""
-        if self.client:
+        # The HTTP session, spool and transfer limits are independent of the Telegram login
+        self._get_http_session()
+        spool_manager.start()
+        if not self.download_slots:
+            self.download_slots = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+            self.upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        
+        if self.clients:
             logger.info("Telegram client already started")
             return
         
         logger.info("Starting Telegram client")
         
-        if not all([TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE]):
+        if not all([TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_SESSIONS]):
             error_msg = "Telegram credentials not found. Please set TELEGRAM_API_ID, TELEGRAM_API_HASH, and TELEGRAM_PHONE environment variables."
             logger.error(error_msg)
             raise ValueError(error_msg)
@@ -34,18 +94,112 @@ class TelegramService:
         # Ensure the data directory exists
         os.makedirs(os.path.dirname(SESSION_FILE_PATH), exist_ok=True)
         
-        # Initialize client
-        self.client = TelegramClient(SESSION_FILE_PATH, TELEGRAM_API_ID, TELEGRAM_API_HASH)
-        await self.client.start(phone=TELEGRAM_PHONE)
+        # Initialize one client per session, each with its own session file
+        clients = []
+        for index, phone in enumerate(TELEGRAM_SESSIONS):
+            session_path = SESSION_FILE_PATH if index == 0 else f"{SESSION_FILE_PATH}_{index + 1}"
+            name = os.path.basename(session_path)
+            # Report every FloodWait instead of sleeping inside the request,
+            # so the rate limiter can pause all sends of the client
+            client = TelegramClient(session_path, TELEGRAM_API_ID, TELEGRAM_API_HASH, flood_sleep_threshold=0)
+            try:
+                await client.start(phone=phone)
+                
+                me = await client.get_me()
+                logger.info(f"Logged in as {me.first_name} ({name})")
+                
+                # Validate the channel at startup
+                await self._validate_channel(client, PRIVATE_CHANNEL_ID)
+            except Exception as e:
+                logger.error(f"Skipping session {name}: {str(e)}")
+                await client.disconnect()
+                continue
+            
+            clients.append(ClientSlot(name, client, me))
+        
+        if not clients:
+            self.channel_validated = False
+            raise ValueError("No Telegram session could be started")
+        
+        self.clients = clients
+        self.channel_validated = True
+        logger.info(f"Telegram client started successfully ({len(clients)} sessions)")
+    
+    async def stop(self):
+        """Close the HTTP session and disconnect the Telegram client"""
+        if self.http_session:
+            await self.http_session.close()
+            self.http_session = None
+        
+        for slot in self.clients:
+            await slot.client.disconnect()
+        self.clients = []
+        metadata_extractor.stop()
+        
+        logger.info("Telegram client stopped")
+    
+    def _get_http_session(self):
+        """Get the shared HTTP session, creating it on first use"""
+        if self.http_session and not self.http_session.closed:
+            return self.http_session
         
-        self.me = await self.client.get_me()
-        logger.info(f"Logged in as {self.me.first_name}")
+        # Count how often pooled connections and cached DNS entries are reused
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(self._on_dns_cache_miss)
         
-        # Validate the channel at startup
-        await self._validate_channel(PRIVATE_CHANNEL_ID)
-        logger.info("Telegram client started successfully")
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_TTL,
+        )
+        # No total timeout, large files may legitimately take a long time
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        self.http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[trace_config],
+        )
+        return self.http_session
+    
+    async def _on_connection_create(self, session, context, params):
+        self.http_stats["connections_created"] += 1
+    
+    async def _on_connection_reuse(self, session, context, params):
+        self.http_stats["connections_reused"] += 1
+    
+    async def _on_dns_cache_hit(self, session, context, params):
+        self.http_stats["dns_cache_hits"] += 1
+    
+    async def _on_dns_cache_miss(self, session, context, params):
+        self.http_stats["dns_cache_misses"] += 1
+    
+    def get_stats(self):
+        """Get runtime statistics of the service"""
+        return {
+            "http": dict(self.http_stats),
+            "clients": [
+                {
+                    "name": slot.name,
+                    "in_flight": slot.in_flight,
+                    "uploads": slot.uploads,
+                    "flood_wait_remaining": round(slot.flood_wait_remaining()),
+                }
+                for slot in self.clients
+            ],
+        }
+    
+    def get_rate_limits(self):
+        """Get the send rate and FloodWait pause of every client"""
+        return {slot.name: slot.limiter.get_stats() for slot in self.clients}
     
-    async def _validate_channel(self, channel_id):
+    async def _validate_channel(self, client, channel_id):
         """Validate if a channel is accessible by the client"""
         if not channel_id:
             error_msg = "No channel ID provided. Set PRIVATE_CHANNEL_ID in your environment variables."
@@ -58,59 +212,325 @@ class TelegramService:
                 channel_id = int(channel_id)
                 
             # Try to get the entity
-            entity = await self.client.get_entity(channel_id)
+            entity = await client.get_entity(channel_id)
             logger.info(f"Channel validated: {getattr(entity, 'title', str(entity))}")
-            self.channel_validated = True
             return True
         except Exception as e:
             logger.error(f"Channel validation failed: {str(e)}")
-            self.channel_validated = False
             raise ValueError(f"Cannot access channel {channel_id}. Please check your PRIVATE_CHANNEL_ID environment variable.")
     
-    async def download_file(self, url):
-        """Download file from URL"""
+    @asynccontextmanager
+    async def _acquire_client(self):
+        """Lend the least-loaded client that is not in a FloodWait"""
+        while True:
+            available = [slot for slot in self.clients if not slot.flood_wait_remaining()]
+            if available:
+                slot = min(available, key=lambda slot: slot.in_flight)
+                break
+            
+            # Every client is rate limited, wait for the first one to recover
+            wait = min(slot.flood_wait_remaining() for slot in self.clients)
+            logger.warning(f"All clients in FloodWait, waiting {wait:.0f}s")
+            await asyncio.sleep(wait)
+        
+        slot.in_flight += 1
+        try:
+            yield slot
+            slot.uploads += 1
+        except FloodWaitError as e:
+            # Also raised by requests that don't go through _send_file, like uploaded parts
+            slot.limiter.on_flood_wait(e)
+            logger.warning(f"FloodWait of {e.seconds}s on {slot.name}")
+            raise
+        finally:
+            slot.in_flight -= 1
+    
+    def _get_limiter(self, client):
+        """Get the rate limiter of a client in the pool"""
+        return next(slot.limiter for slot in self.clients if slot.client is client)
+    
+    async def _send_file(self, client, *args, **kwargs):
+        """Send a message through the client's rate limiter.
+        
+        FloodWaits up to FLOOD_WAIT_MAX seconds are waited out and the message
+        is sent again, longer ones are raised. Transient errors are retried
+        with backoff by the retry policy.
+        """
+        limiter = self._get_limiter(client)
+        attempt = 1
+        while True:
+            await limiter.acquire()
+            try:
+                message = await client.send_file(*args, **kwargs)
+            except FloodWaitError as e:
+                limiter.on_flood_wait(e)
+                if e.seconds > FLOOD_WAIT_MAX:
+                    raise
+                continue
+            except Exception as e:
+                if not await retry_policy.backoff(attempt, e, "send"):
+                    raise
+                attempt += 1
+                continue
+            
+            limiter.on_success()
+            return message
+    
+    async def download_file(self, url, headers=None, progress=None, partial=None):
+        """Download file from URL, retrying transient errors.
+        
+        A retried download continues from the last byte written when the
+        server supports ranges, otherwise it starts over. partial is a
+        FetchedFile of an interrupted download to continue, its spooled
+        copy is removed if the download fails. Big files are downloaded in
+        segments when the server supports ranges. New downloads wait while
+        the spool is full.
+        """
         # Use shorter URL in logs
         url_short = url if len(url) < 60 else f"{url[:30]}...{url[-20:]}"
         logger.debug(f"Downloading: {url_short}")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.error(f"Download failed: HTTP {response.status}")
-                    raise Exception(f"Failed to download file: HTTP {response.status}")
-                
-                # Get the filename from URL or headers
-                content_disposition = response.headers.get("Content-Disposition", "")
-                content_type = response.headers.get("Content-Type", "")
-                
-                if "filename=" in content_disposition:
-                    filename = content_disposition.split("filename=")[1].strip('"')
+        session = self._get_http_session()
+        fetched = partial
+        file_ext = None
+        attempt = 1
+        try:
+            if not partial:
+                await spool_manager.wait_for_space()
+            async with self.download_slots:
+                while True:
+                    resume_headers = self._get_resume_headers(fetched) if fetched else None
+                    try:
+                        async with session.get(url, headers=resume_headers or headers) as response:
+                            if resume_headers and self._is_resumed(response, fetched):
+                                logger.info(f"Resuming download of {fetched.filename} at byte {fetched.size}")
+                            else:
+                                self._check_response(response)
+                                # The whole file is sent again, drop what was saved so far
+                                self._discard(fetched)
+                                filename, file_ext = self._get_filename(url, response)
+                                fetched = FetchedFile(filename, response.headers, progress)
+                                if self._can_segment(response, fetched):
+                                    await SegmentedDownloader(session, url, fetched).download(response, file_ext)
+                                    return fetched
+                            await self._save_response(response, fetched, file_ext)
+                            return fetched
+                    except Exception as e:
+                        # Segments were already retried one by one
+                        if fetched and fetched.segments or not await retry_policy.backoff(attempt, e, "download"):
+                            raise
+                        attempt += 1
+        except BaseException:
+            self._discard(fetched)
+            raise
+    
+    def _get_resume_headers(self, fetched):
+        """Get the headers requesting the rest of a partial download, or None if it can't be resumed"""
+        if not fetched.spool or not fetched.size or not fetched.resumable:
+            return None
+        
+        validator = fetched.get_range_validator()
+        if not validator:
+            return None
+        
+        return {
+            "Range": f"bytes={fetched.size}-",
+            "If-Range": validator,
+            "Accept-Encoding": "identity",
+        }
+    
+    def _can_segment(self, response, fetched):
+        """Whether a download is big enough to split and the server can send it in ranges"""
+        return (
+            DOWNLOAD_SEGMENTS > 1
+            and response.content_length is not None
+            and response.content_length >= SEGMENTED_DOWNLOAD_SIZE
+            and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            and fetched.resumable
+            # Every segment must come from the same version of the file
+            and fetched.get_range_validator() is not None
+        )
+    
+    def _is_resumed(self, response, fetched):
+        """Whether a response continues the partial download exactly where it stopped"""
+        content_range = response.headers.get("Content-Range", "")
+        return response.status == 206 and content_range.startswith(f"bytes {fetched.size}-")
+    
+    def _discard(self, fetched):
+        """Remove the spooled copy of a download that is done, started over or given up"""
+        if fetched and fetched.spool:
+            fetched.spool.remove()
+            fetched.spool = None
+            fetched.temp_path = None
+    
+    async def _save_response(self, response, fetched, file_ext):
+        """Stream a response body to the spool, hashing it on the way.
+        
+        Small files are kept in memory, bigger ones go to a file in the
+        spool directory. Appends to the spooled copy of fetched if it has
+        one already, so a resumed download continues the same file and
+        hash. The copy is left in place if this fails, for the caller to
+        resume or discard.
+        """
+        progress = fetched.progress
+        if fetched.spool is None:
+            # A body of unknown size starts in memory and moves to disk if it grows too big
+            content_length = response.content_length
+            in_memory = content_length is None or content_length <= spool_manager.memory_threshold
+            fetched.spool = spool_manager.new_file(file_ext, in_memory)
+            fetched.hasher = hashlib.sha256()
+            if progress:
+                progress.set_phase("downloading", response.content_length)
+        
+        with fetched.spool as spool_file, fetched.download_stage as stage:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                # Content-Length may be missing or wrong, so keep checking
+                if fetched.size + len(chunk) > MAX_DOWNLOAD_SIZE:
+                    raise Exception(f"File too large: exceeded limit of {MAX_DOWNLOAD_SIZE} bytes")
+                spool_file.write(chunk)
+                fetched.hasher.update(chunk)
+                if len(fetched.head) < sniffer.SNIFF_SIZE:
+                    fetched.head += chunk[:sniffer.SNIFF_SIZE - len(fetched.head)]
+                fetched.size += len(chunk)
+                if progress:
+                    progress.set_downloaded(fetched.size)
+        
+        metrics.DOWNLOAD_SECONDS.observe(stage.seconds)
+        metrics.observe_transfer("download", fetched.size, stage.seconds)
+        logger.info(f"Downloaded: {fetched.filename} ({fetched.size} bytes)")
+        
+        # Files kept in memory are sent as bytes
+        fetched.temp_path = fetched.spool.path
+        fetched.file = fetched.temp_path or fetched.spool.getvalue()
+        fetched.content_hash = fetched.hasher.hexdigest()
+    
+    def _check_response(self, response):
+        """Validate the HTTP status and the announced size of a download"""
+        # Only sent back when the request carried the cached validators
+        if response.status == 304:
+            raise NotModified()
+        
+        if response.status != 200:
+            logger.error(f"Download failed: HTTP {response.status}")
+            raise DownloadError(response.status)
+        
+        # Reject files that are too big before reading anything
+        content_length = response.content_length
+        if content_length is not None and content_length > MAX_DOWNLOAD_SIZE:
+            logger.error(f"Download rejected: {content_length} bytes exceeds limit")
+            raise Exception(f"File too large: {content_length} bytes (limit {MAX_DOWNLOAD_SIZE} bytes)")
+    
+    def _get_filename(self, url, response):
+        """Get the filename and extension from URL or headers"""
+        content_disposition = response.headers.get("Content-Disposition", "")
+        content_type = response.headers.get("Content-Type", "")
+        
+        if "filename=" in content_disposition:
+            filename = content_disposition.split("filename=")[1].strip('"')
+        else:
+            filename = url.split("/")[-1]
+            # Make sure filename has an extension
+            if "." not in filename:
+                ext = self._get_extension_from_content_type(content_type)
+                if ext:
+                    filename = f"{filename}.{ext}"
                 else:
-                    filename = url.split("/")[-1]
-                    # Make sure filename has an extension
-                    if "." not in filename:
-                        ext = self._get_extension_from_content_type(content_type)
-                        if ext:
-                            filename = f"{filename}.{ext}"
-                        else:
-                            filename = "downloaded_file"
+                    filename = "downloaded_file"
+        
+        # Extract file extension
+        file_ext = os.path.splitext(filename)[1]
+        if not file_ext:
+            file_ext = self._get_extension_from_content_type(content_type)
+            if file_ext:
+                file_ext = f".{file_ext}"
+        
+        return filename, file_ext
+    
+    async def pipe_file(self, url, client, headers=None, progress=None, force_document=False):
+        """Upload a file to Telegram while it is still being downloaded.
+        
+        When the source reports its size, the returned file is a handle
+        uploaded through client and nothing is spooled. Otherwise the body
+        is saved to the spool as usual. Videos and audio are spooled too,
+        unless force_document is set, so their metadata can be read. A
+        failed pipelined transfer is retried through a spooled download, as
+        are transient errors of the source.
+        """
+        url_short = url if len(url) < 60 else f"{url[:30]}...{url[-20:]}"
+        logger.debug(f"Piping: {url_short}")
+        
+        session = self._get_http_session()
+        fetched = None
+        try:
+            await spool_manager.wait_for_space()
+            async with self.download_slots, session.get(url, headers=headers) as response:
+                self._check_response(response)
+                filename, file_ext = self._get_filename(url, response)
+                fetched = FetchedFile(filename, response.headers, progress)
+                
+                # Telethon has to know the part count before the first part is sent,
+                # and Content-Length counts compressed bytes when an encoding is used
+                encoding = response.headers.get("Content-Encoding", "identity").lower()
+                if response.content_length is None or encoding != "identity":
+                    logger.debug("Size unknown, saving to the spool")
+                    await self._save_response(response, fetched, file_ext)
+                    return fetched
                 
-                # Extract file extension
-                file_ext = os.path.splitext(filename)[1]
-                if not file_ext:
-                    file_ext = self._get_extension_from_content_type(content_type)
-                    if file_ext:
-                        file_ext = f".{file_ext}"
+                # One connection is slower than several for throttled sources,
+                # and the parts of a saved file are uploaded in parallel too
+                if self._can_segment(response, fetched):
+                    logger.debug("Big file, downloading in segments")
+                    await SegmentedDownloader(session, url, fetched).download(response, file_ext)
+                    return fetched
                 
-                # Save file to temp directory with proper extension
-                with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as temp_file:
-                    content = await response.read()
-                    temp_file.write(content)
-                    temp_path = temp_file.name
-                    
-                logger.info(f"Downloaded: {filename} ({len(content)} bytes)")
+                # The duration and dimensions can't be read from an uploaded handle,
+                # without them Telegram shows a video as 0:00 and a square placeholder
+                if not force_document and self._get_file_type(filename) in ("video", "audio"):
+                    logger.debug("Video or audio, saving to the spool to read its metadata")
+                    await self._save_response(response, fetched, file_ext)
+                    return fetched
                 
-                return temp_path, filename
+                stream = _ResponseStream(response, filename, response.content_length, progress)
+                try:
+                    async with self.upload_slots:
+                        if progress:
+                            progress.set_phase("transferring", stream.size)
+                        with metrics.Stage("pipeline") as stage:
+                            file_handle = await client.upload_file(
+                                stream,
+                                file_size=stream.size,
+                                file_name=filename,
+                                progress_callback=progress.set_uploaded if progress else None,
+                            )
+                    logger.info(f"Downloaded: {filename} ({stream.bytes_read} bytes, pipelined)")
+                    metrics.observe_transfer("download", stream.bytes_read, stage.seconds)
+                    fetched.upload_seconds = stage.seconds
+                    fetched.file = file_handle
+                    fetched.size = stream.bytes_read
+                    fetched.content_hash = stream.content_hash.hexdigest()
+                    fetched.head = stream.head
+                    return fetched
+                except FloodWaitError as e:
+                    # Sending the parts again from disk waits for the client's pause
+                    # in _upload_handle, but not for a wait longer than a task should take
+                    self._get_limiter(client).on_flood_wait(e)
+                    if e.seconds > FLOOD_WAIT_MAX:
+                        raise
+                    logger.warning(f"FloodWait of {e.seconds}s during pipelined transfer, sending from disk after it")
+                except Exception as e:
+                    logger.warning(f"Pipelined transfer failed after {stream.bytes_read} bytes: {str(e)}")
+        except Exception as e:
+            if fetched and fetched.segments or not await retry_policy.backoff(1, e, "download"):
+                self._discard(fetched)
+                raise
+            # Continues the spooled copy if the body was being saved
+            return await self.download_file(url, headers, progress, partial=fetched)
+        except BaseException:
+            self._discard(fetched)
+            raise
+        
+        # The response is partly consumed, so start over through the spool
+        return await self.download_file(url, progress=progress)
     
     def _get_extension_from_content_type(self, content_type):
         """Get file extension from content type"""
@@ -169,9 +589,278 @@ class TelegramService:
         
         return "document"
     
-    async def upload_file_to_channel(self, url, task_id, channel_id=None, force_document=False):
-        """Upload file to the private channel for processing by bots"""
-        if not self.client:
+    def guess_file_type(self, url):
+        """Guess the file type from the extension in the URL path"""
+        return self._get_file_type(urlparse(url).path)
+    
+    async def _fetch(self, url, client, headers=None, progress=None, force_document=False):
+        """Get the file from URL, pipelined into client when enabled"""
+        if PIPELINE_UPLOADS:
+            # Upload while downloading, skipping the spool if possible
+            return await self.pipe_file(url, client, headers, progress, force_document)
+        
+        # Download the file from URL
+        return await self.download_file(url, headers, progress)
+    
+    async def _upload_media(self, client, channel_id, fetched, caption, force_document):
+        """Upload a fetched file if needed and send it to the channel"""
+        # Check the type guessed from the extension against the first bytes,
+        # a wrong guess fails the send and uploads the file again as a document
+        guessed = self._get_file_type(fetched.filename)
+        content = sniffer.sniff(fetched.head)
+        file_type, reason = sniffer.choose_file_type(guessed, content, fetched.size)
+        if reason:
+            logger.info(f"Sending {fetched.filename} as {file_type} instead of {guessed}: {reason}")
+        logger.debug(f"Processing: {fetched.filename} (type: {file_type}, content: {content})")
+        fetched.content_format = content.format if content else None
+        fetched.sent_as = "document" if force_document else file_type
+        # Forcing a GIF or WebP to a document sends a plain file instead of an
+        # animation or sticker, so Telethon decides from its extension
+        send_type = "photo" if not force_document and sniffer.is_document_image(content) else fetched.sent_as
+        filename = sniffer.fix_extension(fetched.filename, content, send_type)
+        
+        file = fetched.file
+        attributes = None
+        thumb = None
+        method = "pipelined"
+        stage = metrics.Stage("upload")
+        if fetched.stored:
+            method = "direct"
+            if fetched.temp_path and UPLOAD_WORKERS > 1 and fetched.size > BIG_FILE_SIZE:
+                method = "parallel"
+            elif isinstance(file, bytes):
+                method = "memory"
+            upload = self._upload_handle(client, fetched, filename, stage, method == "parallel")
+            if fetched.sent_as in ("video", "audio"):
+                # Telethon can't read metadata from an uploaded handle, so it is read from
+                # the file in a worker process while the bytes are being uploaded
+                metadata = metadata_extractor.extract(fetched.temp_path or fetched.file, filename, fetched.sent_as)
+                file, (attributes, thumb) = await asyncio.gather(upload, metadata)
+            else:
+                file = await upload
+        elif filename != fetched.filename:
+            # Pipelined, the handle is sent under its name
+            file.name = filename
+        
+        try:
+            async with self.upload_slots:
+                with stage:
+                    message = await self._send_media(
+                        client, channel_id, file, filename, send_type, caption, force_document, attributes, thumb,
+                    )
+        except EXPIRED_UPLOAD_ERRORS as e:
+            # Pipelined bytes can't be read again
+            if not fetched.stored:
+                raise
+            logger.warning(f"Uploaded parts of {filename} are gone, uploading it again: {str(e)}")
+            fetched.handle = None
+            file = await self._upload_handle(client, fetched, filename, stage, method == "parallel")
+            async with self.upload_slots:
+                with stage:
+                    message = await self._send_media(
+                        client, channel_id, file, filename, send_type, caption, force_document, attributes, thumb,
+                    )
+        
+        # Pipelined files were uploaded while downloading, count that time too
+        upload_seconds = fetched.upload_seconds + stage.seconds
+        metrics.UPLOAD_SECONDS.labels(method).observe(upload_seconds)
+        metrics.observe_transfer("upload", fetched.size, upload_seconds)
+        fetched.uploaded = True
+        return message
+    
+    async def _upload_handle(self, client, fetched, filename, stage, parallel=False):
+        """Upload the bytes of a stored file once and get its handle.
+        
+        The handle is kept on fetched, so a send that fails and is retried,
+        as a document or after a transient error, only costs another small
+        request. Uploaded parts belong to the session of client. Like
+        _send_file, the upload waits while the client is paused by a FloodWait
+        and waits out FloodWaits up to FLOOD_WAIT_MAX seconds, longer ones are
+        raised. Transient errors during the upload are retried with backoff.
+        """
+        if fetched.handle is not None and fetched.handle_client is client:
+            return fetched.handle
+        
+        progress_callback = None
+        if fetched.progress:
+            fetched.progress.set_phase("uploading", fetched.size)
+            progress_callback = fetched.progress.set_uploaded
+        
+        # Telethon takes the name and media type from the file: bytes have no name
+        # and the spool file may have the wrong extension, so upload them under filename
+        limiter = self._get_limiter(client)
+        attempt = 1
+        while True:
+            # Parts are not messages, so they only wait for the pause, not for a token
+            await limiter.wait_for_pause()
+            try:
+                async with self.upload_slots:
+                    with stage:
+                        if parallel:
+                            # Big files go over several connections at once
+                            uploader = ParallelUploader(client, limiter=limiter)
+                            handle = await uploader.upload(fetched.temp_path, filename, progress_callback)
+                        else:
+                            handle = await client.upload_file(
+                                fetched.file, file_name=filename, progress_callback=progress_callback,
+                            )
+                break
+            except FloodWaitError as e:
+                limiter.on_flood_wait(e)
+                if e.seconds > FLOOD_WAIT_MAX:
+                    raise
+                logger.warning(f"FloodWait of {e.seconds}s while uploading {filename}, uploading it again after it")
+            except Exception as e:
+                if not await retry_policy.backoff(attempt, e, "upload"):
+                    raise
+                attempt += 1
+        
+        fetched.handle = handle
+        fetched.handle_client = client
+        return handle
+    
+    async def _resend_media(self, client, channel_id, cached, caption):
+        """Send previously uploaded media again without uploading its bytes.
+        
+        Returns None if the stored reference can't be used anymore.
+        """
+        file_reference = bytes.fromhex(cached.file_reference or "")
+        if cached.media_type == "photo":
+            media = InputPhoto(int(cached.media_id), int(cached.access_hash), file_reference)
+        else:
+            media = InputDocument(int(cached.media_id), int(cached.access_hash), file_reference)
+        
+        try:
+            message = await self._send_file(client, channel_id, media, caption=caption)
+            logger.info(f"Reused media of message {cached.message_id}")
+            return message
+        except FloodWaitError:
+            raise
+        except Exception as e:
+            # Usually an expired file reference, refresh it from the original message
+            logger.debug(f"Stored media reference rejected: {str(e)}")
+        
+        try:
+            original = await client.get_messages(int(cached.channel_id), ids=int(cached.message_id))
+            if original and original.media:
+                message = await self._send_file(client, channel_id, original.media, caption=caption)
+                logger.info(f"Reused media of message {cached.message_id}")
+                return message
+        except FloodWaitError:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to reuse media of message {cached.message_id}: {str(e)}")
+        
+        return None
+    
+    def _get_media_info(self, message):
+        """Get the identifiers and properties of the media in a message"""
+        if message.photo:
+            media_type, media = "photo", message.photo
+        elif message.document:
+            media_type, media = "document", message.document
+        else:
+            return None
+        
+        info = {
+            "media_type": media_type,
+            "media_id": str(media.id),
+            "access_hash": str(media.access_hash),
+            "file_reference": media.file_reference.hex() if media.file_reference else None,
+            "file_size": None,
+            "mime_type": None,
+            "width": None,
+            "height": None,
+            "duration": None,
+        }
+        
+        if media_type == "photo":
+            # The largest size is the original photo
+            sizes = [size for size in media.sizes if isinstance(size, (PhotoSize, PhotoSizeProgressive))]
+            if sizes:
+                largest = max(sizes, key=lambda size: size.w * size.h)
+                info["width"], info["height"] = largest.w, largest.h
+                info["file_size"] = largest.size if isinstance(largest, PhotoSize) else max(largest.sizes)
+            info["mime_type"] = "image/jpeg"
+        else:
+            info["file_size"] = media.size
+            info["mime_type"] = media.mime_type
+            for attr in media.attributes:
+                if isinstance(attr, (DocumentAttributeVideo, DocumentAttributeImageSize)):
+                    info["width"], info["height"] = attr.w, attr.h
+                if isinstance(attr, (DocumentAttributeVideo, DocumentAttributeAudio)):
+                    info["duration"] = attr.duration
+        
+        return info
+    
+    async def _send_media(self, client, channel_id, file, filename, file_type, caption, force_document,
+                          attributes=None, thumb=None):
+        """Send an uploaded file handle, falling back to a document"""
+        # Send based on file type or force_document setting
+        try:
+            if force_document:
+                # Always send as document if forced
+                return await self._send_file(
+                    client,
+                    channel_id,
+                    file,
+                    caption=caption,
+                    file_name=filename,
+                    force_document=True,
+                )
+            else:
+                # Send based on file type
+                force_doc = file_type == "document"
+                supports_streaming = file_type == "video"
+                
+                return await self._send_file(
+                    client,
+                    channel_id,
+                    file,
+                    caption=caption,
+                    force_document=force_doc,
+                    supports_streaming=supports_streaming,
+                    attributes=attributes,
+                    thumb=thumb,
+                )
+        except (FloodWaitError, *EXPIRED_UPLOAD_ERRORS):
+            # Sending again right away would only extend the wait, or fail the same way
+            raise
+        except Exception as e:
+            logger.error(f"Failed to send file: {str(e)}")
+            # Try as document as a fallback
+            if not force_document:
+                logger.info("Retrying as document")
+                metrics.SEND_FALLBACKS.labels(file_type).inc()
+                return await self._send_file(
+                    client,
+                    channel_id,
+                    file,
+                    caption=caption,
+                    file_name=filename,
+                    force_document=True,
+                )
+            else:
+                # Re-raise the exception if we were already trying as document
+                raise
+    
+    async def open_file(self, path, progress=None):
+        """Wrap a file that is already on disk like a downloaded one"""
+        fetched = FetchedFile(os.path.basename(path), {}, progress)
+        fetched.file = fetched.temp_path = path
+        fetched.size = os.path.getsize(path)
+        fetched.content_hash = await asyncio.get_running_loop().run_in_executor(None, _hash_file, path)
+        fetched.head = sniffer.read_head(path)
+        return fetched
+    
+    async def upload_file_to_channel(self, url, task_id, channel_id=None, force_document=False, progress=None,
+                                     local_path=None):
+        """Upload file to the private channel for processing by bots.
+        
+        With local_path, that file is sent instead of downloading url. It is
+        left in place for the caller to delete.
+        """
+        if not self.clients:
             await self.start()
         
         try:
@@ -187,71 +876,482 @@ class TelegramService:
             if not self.channel_validated:
                 raise ValueError(f"Channel {channel_id} was not validated at startup")
             
-            # Download the file from URL
-            temp_path, filename = await self.download_file(url)
-            
-            # Determine file type from extension
-            file_type = self._get_file_type(filename)
-            logger.debug(f"Processing: {filename} (type: {file_type})")
-            
             # Caption for all messages
             caption = f"Task ID: {task_id}"
             
-            # Send based on file type or force_document setting
-            try:
-                if force_document:
-                    # Always send as document if forced
-                    message = await self.client.send_file(
-                        channel_id,
-                        temp_path,
-                        caption=caption,
-                        file_name=filename,
-                        force_document=True
-                    )
-                else:
-                    # Send based on file type
-                    force_doc = file_type == "document"
-                    supports_streaming = file_type == "video"
-                    
-                    message = await self.client.send_file(
-                        channel_id,
-                        temp_path,
-                        caption=caption,
-                        force_document=force_doc,
-                        supports_streaming=supports_streaming,
-                    )
-            except Exception as e:
-                logger.error(f"Failed to send file: {str(e)}")
-                # Try as document as a fallback
-                if not force_document:
-                    logger.info("Retrying as document")
-                    message = await self.client.send_file(
-                        channel_id,
-                        temp_path,
-                        caption=caption,
-                        file_name=filename,
-                        force_document=True
-                    )
-                else:
-                    # Re-raise the exception if we were already trying as document
-                    raise
+            # Ask the source whether the file changed since it was last uploaded
+            url_entry = await dedup.get_url_entry(url) if DEDUP_ENABLED and not local_path else None
+            headers = dedup.get_conditional_headers(url_entry) if url_entry else None
             
-            # Clean up temporary file
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temporary file: {str(e)}")
+            # Hash files sent to the API before taking a client
+            local = await self.open_file(local_path, progress) if local_path else None
+            
+            # Uploaded parts belong to one session, so one client does the whole upload
+            async with self._acquire_client() as slot:
+                fetched = None
+                cached = None
+                message = None
+                
+                try:
+                    fetched = local or await self._fetch(url, slot.client, headers, progress, force_document)
+                except NotModified:
+                    cached = await dedup.find_media(url_entry.content_hash)
+                    if cached and dedup.matches(cached, force_document):
+                        message = await self._resend_media(slot.client, channel_id, cached, caption)
+                    if not message:
+                        # The cached media is gone or was sent differently, upload it again
+                        await dedup.forget_url(url)
+                        fetched = await self._fetch(url, slot.client, progress=progress, force_document=force_document)
+                
+                if fetched:
+                    try:
+                        # Same bytes under another URL, reuse the media instead of uploading
+                        if DEDUP_ENABLED and fetched.stored:
+                            cached = await dedup.find_media(fetched.content_hash)
+                            if cached and dedup.matches(cached, force_document):
+                                message = await self._resend_media(slot.client, channel_id, cached, caption)
+                        
+                        if not message:
+                            message = await self._upload_media(slot.client, channel_id, fetched, caption, force_document)
+                    finally:
+                        # Free the spool whether or not the file was sent
+                        self._discard(fetched)
+            
+            deduplicated = fetched is None or not fetched.uploaded
+            if deduplicated:
+                # Resent media keeps what was recorded when it was uploaded
+                content_hash = cached.content_hash
+                content_format = cached.content_format
+                file_type = cached.file_type
+                details = dict(
+                    file_name=cached.file_name, file_type=file_type, content_format=content_format,
+                    force_document=cached.force_document, size=cached.size,
+                )
+            else:
+                content_hash = fetched.content_hash
+                content_format = fetched.content_format
+                file_type = fetched.sent_as
+                details = dict(
+                    file_name=fetched.filename, file_type=file_type, content_format=content_format,
+                    force_document=force_document, size=fetched.size,
+                )
+            validators = (fetched.etag, fetched.last_modified) if fetched else (url_entry.etag, url_entry.last_modified)
+            
+            # Remember the media so the same content is never uploaded twice
+            media = self._get_media_info(message)
+            if DEDUP_ENABLED and media:
+                reference = {key: media[key] for key in ("media_type", "media_id", "access_hash", "file_reference")}
+                reference.update(details, channel_id=str(channel_id), message_id=str(message.id))
+                await dedup.remember(url, content_hash, reference, *validators)
             
             # Return message info
             return {
                 "message_id": message.id,
                 "channel_id": channel_id,
-                "file_type": file_type
+                "file_type": file_type,
+                "content_format": content_format,
+                "deduplicated": deduplicated,
+                "media": media,
             }
             
         except Exception as e:
             logger.error(f"Error uploading file: {str(e)}")
             raise
 
+    async def upload_album_to_channel(self, items, channel_id=None):
+        """Send photos from several URLs as one album.
+        
+        items is a list of (url, task_id). Returns one result per item in the
+        same order, or the exception that item failed with.
+        """
+        if not self.clients:
+            await self.start()
+        
+        channel_id = int(channel_id or PRIVATE_CHANNEL_ID)
+        if not self.channel_validated:
+            raise ValueError(f"Channel {channel_id} was not validated at startup")
+        
+        # Albums are sent from files, so nothing is pipelined
+        downloads = await asyncio.gather(
+            *(self.download_file(url) for url, _ in items),
+            return_exceptions=True
+        )
+        results = list(downloads)
+        ready = [
+            (index, fetched, f"Task ID: {task_id}")
+            for index, ((_, task_id), fetched) in enumerate(zip(items, downloads))
+            if isinstance(fetched, FetchedFile)
+        ]
+        if not ready:
+            return results
+        
+        # Anything Telegram won't take as a photo fails the whole album, so those
+        # are sent on their own
+        album = []
+        names = []
+        singles = []
+        for item in ready:
+            fetched = item[1]
+            content = sniffer.sniff(fetched.head)
+            if sniffer.is_album_photo(content, fetched.size):
+                fetched.content_format = content.format
+                fetched.sent_as = "photo"
+                album.append(item)
+                # The extension of the content, which Telethon recognizes as a photo
+                names.append(sniffer.fix_extension(fetched.filename, content, "photo"))
+            else:
+                singles.append(item)
+        
+        try:
+            async with self._acquire_client() as slot:
+                if album:
+                    try:
+                        # The handles are reused if the album fails
+                        files = await asyncio.gather(*(
+                            self._upload_handle(slot.client, fetched, name, metrics.Stage("upload"))
+                            for (_, fetched, _), name in zip(album, names)
+                        ))
+                        async with self.upload_slots:
+                            messages = await self._send_file(
+                                slot.client,
+                                channel_id,
+                                files,
+                                caption=[caption for _, _, caption in album],
+                            )
+                        if not isinstance(messages, list):
+                            messages = [messages]
+                        for (index, fetched, _), message in zip(album, messages):
+                            results[index] = {
+                                "message_id": message.id,
+                                "channel_id": channel_id,
+                                "file_type": "photo",
+                                "content_format": fetched.content_format,
+                                "media": self._get_media_info(message),
+                            }
+                    except FloodWaitError:
+                        raise
+                    except Exception as e:
+                        # Send them one by one instead
+                        logger.warning(f"Failed to send album, sending {len(album)} files separately: {str(e)}")
+                        singles.extend(album)
+                
+                for index, fetched, caption in singles:
+                    try:
+                        message = await self._upload_media(slot.client, channel_id, fetched, caption, False)
+                        results[index] = {
+                            "message_id": message.id,
+                            "channel_id": channel_id,
+                            "file_type": fetched.sent_as,
+                            "content_format": fetched.content_format,
+                            "media": self._get_media_info(message),
+                        }
+                    except Exception as e:
+                        results[index] = e
+        finally:
+            # Free the spool
+            for _, fetched, _ in ready:
+                self._discard(fetched)
+        
+        logger.info(f"Album uploaded: {len(ready)} of {len(items)} files")
+        return results
+
+class NotModified(Exception):
+    """The source answered 304, the cached copy is still current"""
+
+class DownloadError(Exception):
+    """The source answered with an HTTP error status"""
+    
+    def __init__(self, status):
+        super().__init__(f"Failed to download file: HTTP {status}")
+        self.status = status
+
+class FetchedFile:
+    """A file fetched from a URL, either saved to the spool or already uploaded"""
+    
+    def __init__(self, filename, headers, progress=None):
+        self.filename = filename
+        self.progress = progress  # TaskProgress to report transferred bytes to
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        # Byte offsets only match the saved file when the body isn't compressed
+        self.resumable = (
+            headers.get("Content-Encoding", "identity").lower() == "identity"
+            and headers.get("Accept-Ranges", "").lower() != "none"
+        )
+        self.file = None  # Path, bytes or uploaded handle to send
+        self.temp_path = None
+        self.spool = None  # SpoolFile holding the downloaded bytes
+        self.size = 0
+        self.hasher = None
+        self.content_hash = None
+        self.head = b""  # First bytes, to tell the format from
+        self.content_format = None  # Format found in the head when the file was sent
+        self.sent_as = None  # photo, video, audio or document, as decided before sending
+        self.segments = 0  # Connections used for a segmented download
+        self.download_stage = metrics.Stage("download")  # Adds up the time of every attempt
+        self.uploaded = False
+        self.upload_seconds = 0  # Spent uploading while downloading
+        self.handle = None  # Uploaded InputFile, reused by every send of the file
+        self.handle_client = None
+    
+    @property
+    def stored(self):
+        """Whether the bytes are here, on disk or in memory, rather than uploaded while downloading"""
+        return self.temp_path is not None or isinstance(self.file, bytes)
+    
+    def get_range_validator(self):
+        """Get the If-Range value that makes sure ranges are cut from this version of the file"""
+        # Weak ETags are not allowed in If-Range
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+class ParallelUploader:
+    """Uploads the parts of a big file concurrently over several connections.
+    
+    With the client's limiter, a part refused with a FloodWait up to
+    FLOOD_WAIT_MAX seconds is sent again once the client's pause is over, so
+    the parts already sent are kept. Without it, FloodWaits are raised.
+    """
+    
+    def __init__(self, client, workers=UPLOAD_WORKERS, part_size_kb=UPLOAD_PART_SIZE_KB, limiter=None):
+        self.client = client
+        self.workers = workers
+        self.part_size = part_size_kb * 1024
+        self.limiter = limiter
+        self.sent = 0
+        self.progress_callback = None
+    
+    async def upload(self, path, file_name=None, progress_callback=None):
+        """Upload the file at path and return its InputFileBig handle"""
+        file_size = os.path.getsize(path)
+        self.sent = 0
+        self.progress_callback = progress_callback
+        part_count = (file_size + self.part_size - 1) // self.part_size
+        if part_count > UPLOAD_MAX_PARTS:
+            # Telegram would refuse the file only after most of it was sent
+            raise ValueError(f"{file_size} bytes need {part_count} parts of {self.part_size}, more than {UPLOAD_MAX_PARTS}")
+        file_id = generate_random_long()
+        
+        # Each worker takes the next part from the shared iterator
+        parts = iter(range(part_count))
+        
+        senders = await asyncio.gather(
+            *(self._create_sender() for _ in range(min(self.workers, part_count))),
+            return_exceptions=True
+        )
+        try:
+            errors = [sender for sender in senders if isinstance(sender, BaseException)]
+            if errors:
+                raise errors[0]
+            
+            started = time.monotonic()
+            with open(path, "rb") as f:
+                tasks = [
+                    asyncio.ensure_future(self._send_parts(sender, f.fileno(), file_id, parts, part_count, file_size))
+                    for sender in senders
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # Stop the other connections before they are disconnected and the file closed
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+            elapsed = time.monotonic() - started
+            logger.debug(f"Uploaded {file_size} bytes in {elapsed:.1f}s over {len(senders)} connections")
+        finally:
+            for sender in senders:
+                if isinstance(sender, MTProtoSender):
+                    await sender.disconnect()
+        
+        return InputFileBig(file_id, part_count, file_name or os.path.basename(path))
+    
+    async def _create_sender(self):
+        """Open an extra connection to the client's home DC"""
+        # Same approach as TelegramClient._create_exported_sender, but the
+        # existing auth key is valid on the home DC so nothing is exported
+        client = self.client
+        dc = await client._get_dc(client.session.dc_id)
+        sender = MTProtoSender(client.session.auth_key, loggers=client._log)
+        await sender.connect(client._connection(
+            dc.ip_address,
+            dc.port,
+            dc.id,
+            loggers=client._log,
+            proxy=client._proxy,
+            local_addr=client._local_addr
+        ))
+        return sender
+    
+    async def _send_parts(self, sender, fd, file_id, parts, part_count, file_size):
+        """Send parts until none are left"""
+        for index in parts:
+            data = os.pread(fd, self.part_size, index * self.part_size)
+            result = await self._send_part(sender, SaveBigFilePartRequest(file_id, index, part_count, data))
+            if not result:
+                raise RuntimeError(f"Failed to upload file part {index}")
+            
+            self.sent += len(data)
+            if self.progress_callback:
+                self.progress_callback(self.sent, file_size)
+    
+    async def _send_part(self, sender, request):
+        """Send one part, waiting out FloodWaits through the limiter"""
+        while True:
+            if self.limiter:
+                await self.limiter.wait_for_pause()
+            try:
+                return await sender.send(request)
+            except FloodWaitError as e:
+                if not self.limiter:
+                    raise
+                self.limiter.on_flood_wait(e)
+                if e.seconds > FLOOD_WAIT_MAX:
+                    raise
+
+class SegmentedDownloader:
+    """Downloads the byte ranges of a big file concurrently over several connections"""
+    
+    def __init__(self, session, url, fetched, segments=DOWNLOAD_SEGMENTS):
+        self.session = session
+        self.url = url
+        self.fetched = fetched
+        self.segments = segments
+        self.received = 0
+    
+    async def download(self, response, file_ext):
+        """Save the file of a full response to a file in the spool.
+        
+        The first segment is read from response itself, the others are
+        requested with Range. Failed segments are retried from the last
+        byte written.
+        """
+        fetched = self.fetched
+        size = response.content_length
+        segment_size = -(-size // self.segments)
+        ranges = [(start, min(start + segment_size, size)) for start in range(0, size, segment_size)]
+        fetched.segments = len(ranges)
+        
+        # Reserve the whole file, every segment writes at its own offsets
+        fetched.spool = spool_manager.new_file(file_ext, size=size)
+        fetched.temp_path = fetched.spool.path
+        if fetched.progress:
+            fetched.progress.set_phase("downloading", size)
+        
+        fd = os.open(fetched.temp_path, os.O_WRONLY)
+        try:
+            with fetched.download_stage as stage:
+                tasks = [
+                    asyncio.ensure_future(self._download_segment(fd, start, end, response if start == 0 else None))
+                    for start, end in ranges
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # Stop the other segments before their file is closed
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+        finally:
+            os.close(fd)
+        
+        written = os.path.getsize(fetched.temp_path)
+        if self.received != size or written != size:
+            raise Exception(f"Segmented download incomplete: received {self.received} of {size} bytes")
+        
+        # Segments arrive out of order, so the file is hashed once it's complete
+        fetched.content_hash = await asyncio.get_running_loop().run_in_executor(None, _hash_file, fetched.temp_path)
+        fetched.head = sniffer.read_head(fetched.temp_path)
+        
+        metrics.DOWNLOAD_SECONDS.observe(stage.seconds)
+        metrics.observe_transfer("download", size, stage.seconds)
+        logger.info(f"Downloaded: {fetched.filename} ({size} bytes, {len(ranges)} segments)")
+        
+        fetched.file = fetched.temp_path
+        fetched.size = size
+    
+    async def _download_segment(self, fd, start, end, response=None):
+        """Write bytes start to end of the file, continuing where a failed attempt stopped"""
+        position = start
+        attempt = 1
+        while True:
+            try:
+                if response is None:
+                    response = await self.session.get(self.url, headers=self._get_headers(position, end))
+                    self._check_range(response, position)
+                async with response:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        # The first response carries the whole file, stop at the segment's end
+                        chunk = chunk[:end - position]
+                        os.pwrite(fd, chunk, position)
+                        position += len(chunk)
+                        self.received += len(chunk)
+                        if self.fetched.progress:
+                            self.fetched.progress.set_downloaded(self.received)
+                        if position >= end:
+                            return
+                raise aiohttp.ClientPayloadError(f"Segment ended at byte {position} instead of {end}")
+            except Exception as e:
+                if response is not None:
+                    response.release()
+                response = None
+                if not await retry_policy.backoff(attempt, e, "download"):
+                    raise
+                attempt += 1
+    
+    def _get_headers(self, start, end):
+        """Get the headers requesting bytes start to end of the same version of the file"""
+        return {
+            "Range": f"bytes={start}-{end - 1}",
+            "If-Range": self.fetched.get_range_validator(),
+            "Accept-Encoding": "identity",
+        }
+    
+    def _check_range(self, response, start):
+        """Make sure the response holds the requested range"""
+        content_range = response.headers.get("Content-Range", "")
+        if response.status != 206 or not content_range.startswith(f"bytes {start}-"):
+            response.release()
+            # A 200 here means the file changed since the download started
+            logger.error(f"Segment download failed: HTTP {response.status}")
+            raise DownloadError(response.status)
+
+def _hash_file(path):
+    """SHA-256 of a file, read in chunks"""
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+class _ResponseStream:
+    """File-like view of an HTTP response that Telethon can read parts from"""
+    
+    def __init__(self, response, name, size, progress=None):
+        self.response = response
+        self.name = name
+        self.size = size
+        self.progress = progress
+        self.bytes_read = 0
+        self.content_hash = hashlib.sha256()
+        self.head = b""
+    
+    async def read(self, n=-1):
+        """Read exactly n bytes, or whatever is left of the body"""
+        remaining = self.size - self.bytes_read
+        if n < 0 or n > remaining:
+            n = remaining
+        data = await self.response.content.readexactly(n)
+        self.bytes_read += len(data)
+        self.content_hash.update(data)
+        if len(self.head) < sniffer.SNIFF_SIZE:
+            self.head += data[:sniffer.SNIFF_SIZE - len(self.head)]
+        if self.progress:
+            self.progress.set_downloaded(self.bytes_read)
+        return data
+
 # Create a singleton instance
 telegram_service = TelegramService() 
\ No newline at end of file
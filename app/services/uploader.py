@@ -0,0 +1,238 @@
+import os
+import signal
+import asyncio
+import logging
+from datetime import datetime
+from aiohttp import web
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import select
+
+from app.config import WORKER_ID, UPLOADER_HTTP_HOST, UPLOADER_HTTP_PORT
+from app.database.setup import engine, Base, SessionLocal
+from app.database.migrations import init_db
+from app.models.task import Task
+from app.models.schemas import FileResponse
+from app.services.telegram import telegram_service
+from app.services.queue import task_queue
+from app.services.status_writer import status_writer
+from app.services.notifier import task_notifier, FINAL_STATUSES
+from app.services.status_cache import task_cache
+from app.services.retention import task_retention
+from app.services import metrics
+from app.services.progress import task_progress
+from app.services.uploads import remove_upload
+from app.services.spool import spool_manager
+from app.services.metadata import metadata_extractor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+async def start():
+    """Start the Telegram clients and the queue workers that process tasks"""
+    # Fails if another running process uses the same WORKER_ID
+    spool_manager.start()
+    try:
+        await telegram_service.start()
+    except Exception as e:
+        logger.error(f"Failed to start Telegram client: {str(e)}")
+
+    # Start processing queued tasks, including those interrupted by a restart
+    await status_writer.start()
+    await task_queue.start(process_upload)
+    await task_retention.start()
+
+async def stop():
+    """Stop the workers, leaving unfinished tasks to be recovered"""
+    await task_retention.stop()
+    await task_queue.stop()
+    await status_writer.stop()
+    await task_notifier.stop()
+    await telegram_service.stop()
+
+def get_stats():
+    """Runtime counters of the uploads in this process"""
+    stats = telegram_service.get_stats()
+    stats["queue"] = task_queue.get_stats()
+    stats["status_writer"] = status_writer.get_stats()
+    stats["status_cache"] = task_cache.get_stats()
+    stats["retention"] = task_retention.get_stats()
+    stats["spool"] = spool_manager.get_stats()
+    stats["metadata"] = metadata_extractor.get_stats()
+    return stats
+
+async def serve_stats(host, port):
+    """Serve /metrics, /api/stats and /api/rate-limits like the API does, for an uploader process"""
+    async def get_metrics(request):
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    async def get_uploader_stats(request):
+        return web.json_response(get_stats())
+
+    async def get_rate_limits(request):
+        return web.json_response(telegram_service.get_rate_limits())
+
+    app = web.Application()
+    app.router.add_get("/metrics", get_metrics)
+    app.router.add_get("/api/stats", get_uploader_stats)
+    app.router.add_get("/api/rate-limits", get_rate_limits)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics and stats on {host}:{port}")
+    return runner
+
+async def run():
+    """Process tasks until SIGINT or SIGTERM, for an uploader process without the API"""
+    logger.info(f"=== Starting uploader {WORKER_ID} ===")
+    await init_db(engine, Base.metadata)
+    await start()
+    # The API process only sees its own counters, these are scraped from here
+    stats_server = await serve_stats(UPLOADER_HTTP_HOST, UPLOADER_HTTP_PORT) if UPLOADER_HTTP_PORT else None
+    # and reads the progress of running tasks from the database
+    await task_progress.start_writing()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    try:
+        await stopping.wait()
+    finally:
+        logger.info(f"Stopping uploader {WORKER_ID}")
+        await task_progress.stop_writing()
+        if stats_server:
+            await stats_server.cleanup()
+        await stop()
+        await engine.dispose()
+
+def notify(task: Task):
+    """Push a status change to waiting clients and, once final, to the webhook"""
+    event = FileResponse.model_validate(task).dict()
+    task_cache.put(event)
+    task_notifier.publish(event)
+
+    if task.callback_url and task.status in FINAL_STATUSES:
+        task_notifier.send_webhook(task.callback_url, event)
+
+async def update_task(task: Task, values: dict):
+    """Write task changes through the status writer and apply them to the object"""
+    with metrics.DB_SECONDS.labels("update").time():
+        await status_writer.update(task.id, values)
+    for key, value in values.items():
+        setattr(task, key, value)
+
+def observe_queue_wait(task: Task):
+    """Record how long the task waited for a worker"""
+    if task.created_at:
+        metrics.QUEUE_WAIT_SECONDS.observe(max((datetime.utcnow() - task.created_at).total_seconds(), 0))
+
+async def process_upload(task_id: str):
+    """Process a task claimed by a queue worker"""
+    # Don't hold a connection for the duration of the upload
+    with metrics.DB_SECONDS.labels("load").time():
+        async with SessionLocal() as db:
+            task = await db.get(Task, task_id)
+    if not task:
+        logger.error(f"Task {task_id} not found")
+        return
+
+    if task.album_id:
+        await process_album(task)
+        return
+
+    observe_queue_wait(task)
+    progress = task_progress.start(task_id)
+    with metrics.Stage("task") as stage:
+        try:
+            # Upload file to Telegram channel
+            logger.info(f"Processing: {task_id[:8]}... - {task.url}")
+            notify(task)
+
+            if task.local_path and not os.path.exists(task.local_path):
+                # Written by the API process, which may run where this one can't read it
+                raise FileNotFoundError(
+                    f"Uploaded file {task.local_path} not found, UPLOAD_DIR must be shared by the API and every uploader"
+                )
+
+            result = await telegram_service.upload_file_to_channel(
+                task.url, task_id, force_document=task.force_document, progress=progress, local_path=task.local_path
+            )
+
+            # Update task with channel message ID, media details and status
+            await update_task(task, {
+                "channel_message_id": str(result["message_id"]),
+                **(result["media"] or {}),
+                "content_format": result["content_format"],
+                "sent_as": result["file_type"],
+                "status": "completed",
+            })
+            notify(task)
+
+            logger.info(f"Completed: {task_id[:8]}... - Message ID: {result['message_id']}")
+        except Exception as e:
+            # Update task status to failed
+            logger.error(f"Failed: {task_id[:8]}... - {str(e)}")
+            metrics.FAILURES.labels(type(e).__name__).inc()
+            await update_task(task, {"status": "failed", "error_message": str(e)})
+            notify(task)
+        finally:
+            task_progress.finish(task_id)
+            # Kept while unfinished, so a task interrupted by a restart can run again
+            if task.local_path and task.status in FINAL_STATUSES:
+                remove_upload(task.local_path)
+
+    metrics.TASK_SECONDS.labels(task.status).observe(stage.seconds)
+
+async def process_album(first_task: Task):
+    """Process the photos of an album together with its first task"""
+    album_id = first_task.album_id
+
+    # The other photos were never queued on their own, claim them here
+    async with SessionLocal() as db:
+        result = await db.execute(select(Task.id).where(Task.album_id == album_id, Task.status == "pending"))
+        pending = list(result.scalars())
+    # Queued together, so they are claimed in one transaction
+    await asyncio.gather(*(task_queue.claim(task_id) for task_id in pending))
+    try:
+        async with SessionLocal() as db:
+            result = await db.execute(select(Task).where(Task.album_id == album_id, Task.status == "processing"))
+            tasks = result.scalars().all()
+
+        logger.info(f"Processing album: {album_id[:8]}... - {len(tasks)} photos")
+        for task in tasks:
+            observe_queue_wait(task)
+            notify(task)
+
+        with metrics.Stage("task") as stage:
+            try:
+                results = await telegram_service.upload_album_to_channel([(task.url, task.id) for task in tasks])
+            except Exception as e:
+                results = [e] * len(tasks)
+
+        updates = []
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed: {task.id[:8]}... - {str(result)}")
+                metrics.FAILURES.labels(type(result).__name__).inc()
+                values = {"status": "failed", "error_message": str(result)}
+            else:
+                values = {
+                    "channel_message_id": str(result["message_id"]),
+                    **(result["media"] or {}),
+                    "content_format": result["content_format"],
+                    "sent_as": result["file_type"],
+                    "status": "completed",
+                }
+            updates.append(update_task(task, values))
+        # Queued together, so they are written in one transaction
+        await asyncio.gather(*updates)
+        for task in tasks:
+            metrics.TASK_SECONDS.labels(task.status).observe(stage.seconds)
+            notify(task)
+
+        logger.info(f"Completed album: {album_id[:8]}...")
+    finally:
+        # The first task is released by its queue worker
+        task_queue.release(*pending)
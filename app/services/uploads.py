@@ -0,0 +1,177 @@
+import os
+import shutil
+import asyncio
+import logging
+from uuid import uuid4
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import UPLOAD_DIR, MAX_DOWNLOAD_SIZE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Form fields other than the file are small, don't buffer more than this
+MAX_FIELD_SIZE = 64 * 1024
+
+# File data collected before it is written to disk in a thread
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    """The uploaded file is bigger than Telegram accepts"""
+
+class FileUpload:
+    """A multipart/form-data body saved to disk while it is received.
+
+    The file part is written chunk by chunk as the body arrives, so memory
+    use doesn't depend on the file size. The writes run in a thread, so a
+    slow disk doesn't hold up other requests. Each upload gets a directory
+    of its own and keeps its original file name, which Telegram shows for
+    documents.
+    """
+
+    def __init__(self, directory=UPLOAD_DIR, max_size=MAX_DOWNLOAD_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.path = None
+        self.filename = None
+        self.size = 0
+        self.fields = {}
+        self._file = None
+        self._in_file = False  # Whether the parser is inside the file part
+        self._buffer = bytearray()  # File data not written yet
+        self._part_ended = False  # The file part is received, the next flush closes the file
+        self._saved = False
+        self._ended = False  # The closing boundary was received
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._field_name = None
+        self._field_value = None
+
+    async def receive(self, request):
+        """Read the request body, raising ValueError if it is malformed"""
+        content_type, params = parse_options_header(request.headers.get("Content-Type", ""))
+        if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise ValueError("Expected a multipart/form-data body")
+
+        parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": self._on_end,
+        })
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if len(self._buffer) >= WRITE_BUFFER_SIZE:
+                    await self._flush()
+            parser.finalize()
+            await self._flush()
+            # finalize() doesn't check that the body is complete, a cut off one never reaches its end
+            if not self._ended or self.path is not None and not self._saved:
+                raise ValueError("Incomplete multipart body, the closing boundary is missing")
+        except BaseException:
+            self.discard()
+            raise
+        finally:
+            if self._file:
+                self._file.close()
+
+        if self.path is None:
+            raise ValueError("No file in the request")
+        logger.info(f"Received upload: {self.filename} ({self.size} bytes)")
+
+    def discard(self):
+        """Delete the received file"""
+        if self._file:
+            self._file.close()
+        if self.path:
+            remove_upload(self.path)
+            self.path = None
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            self._field_name = options.get(b"name", b"").decode("utf-8", "replace")
+            self._field_value = bytearray()
+            return
+
+        if self.path is not None:
+            raise ValueError("Only one file can be uploaded per request")
+
+        # Keep the name only, never a path the client chose
+        filename = options[b"filename"].decode("utf-8", "replace").replace("\\", "/")
+        filename = os.path.basename(filename).strip().replace("\0", "")[:255] or "uploaded_file"
+        self.filename = filename
+        self.path = os.path.join(self.directory, uuid4().hex, filename)
+        self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if not self._in_file:
+            if len(self._field_value) + end - start > MAX_FIELD_SIZE:
+                raise ValueError(f"Form field {self._field_name} is too large")
+            self._field_value += data[start:end]
+            return
+
+        self.size += end - start
+        if self.size > self.max_size:
+            raise UploadTooLarge(f"File too large: exceeded limit of {self.max_size} bytes")
+        self._buffer += data[start:end]
+
+    def _on_part_end(self):
+        if not self._in_file:
+            self.fields[self._field_name] = self._field_value.decode("utf-8", "replace")
+            return
+
+        self._in_file = False
+        self._part_ended = True
+
+    def _on_end(self):
+        self._ended = True
+
+    async def _flush(self):
+        """Write the buffered file data in a thread, closing the file once its part ended"""
+        if self.path is None or self._saved:
+            return
+
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        close = self._part_ended
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data, close)
+        self._saved = close
+
+    def _write(self, data, close):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path))
+            self._file = open(self.path, "wb")
+        self._file.write(data)
+        if close:
+            self._file.close()
+            self._file = None
+
+def remove_upload(path):
+    """Delete an uploaded file together with its directory"""
+    try:
+        shutil.rmtree(os.path.dirname(path))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to delete uploaded file: {str(e)}")
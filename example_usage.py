@@ -1,5 +1,4 @@
 import requests
-import time
 import os
 import asyncio
 from telegram import Bot, Update
@@ -25,10 +24,10 @@ def upload_file(url, force_document=False):
     response.raise_for_status()
     return response.json()
 
-def get_task_status(task_id):
-    """Get status for a specific task (with polling)"""
+def get_task_status(task_id, wait=30):
+    """Get status for a specific task, waiting up to `wait` seconds for it to finish"""
     try:
-        response = requests.get(f"{API_URL}/api/file/{task_id}")
+        response = requests.get(f"{API_URL}/api/file/{task_id}", params={"wait": wait})
         response.raise_for_status()
         return response.json(), None
     except:
@@ -164,6 +163,7 @@ async def upload_example():
                     # Task has a status
                     if task_info["status"] == "completed":
                         print(f"Upload completed - Message ID: {task_info.get('channel_message_id')}")
+                        print(f"Media: {task_info.get('media_type')} {task_info.get('media_id')} ({task_info.get('mime_type')}, {task_info.get('file_size')} bytes)")
                         
                         # Store result for summary
                         results.append({
@@ -184,8 +184,8 @@ async def upload_example():
                     status = detail.get("status", "unknown")
                     print(f"Status: {status}")
                 
+                # The API already waited for the task, ask again right away
                 retry_count += 1
-                time.sleep(2)
             
             if not success:
                 print("Failed: maximum retries reached")
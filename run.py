@@ -18,12 +18,19 @@ if __name__ == "__main__":
                        help='Port to bind to')
     parser.add_argument('--reload', action='store_true',
                        help='Enable auto-reload on code changes')
+    parser.add_argument('--workers', type=int,
+                       default=int(os.getenv('API_WORKERS', '1')),
+                       help='API processes to run, more than one needs RUN_UPLOADER=false and uploader.py')
     parser.add_argument('--log-level', type=str, 
                        default="info",
                        choices=["debug", "info", "warning", "error", "critical"],
                        help='Log level')
     args = parser.parse_args()
     
+    # Every API process would start the same Telegram sessions and queue workers
+    if args.workers > 1 and os.getenv('RUN_UPLOADER', 'true').lower() == 'true':
+        parser.error('--workers above 1 needs RUN_UPLOADER=false, with uploads run by uploader.py')
+    
     # Configure Uvicorn logger
     log_level = getattr(logging, args.log_level.upper())
     
@@ -31,11 +38,13 @@ if __name__ == "__main__":
     print(f"Starting Telegram Upload API on http://{args.host}:{args.port}")
     print(f"Log level: {args.log_level}")
     print(f"Auto-reload: {'enabled' if args.reload else 'disabled'}")
+    print(f"Workers: {args.workers}")
     
     uvicorn.run(
         "app.main:app", 
         host=args.host, 
         port=args.port, 
         reload=args.reload,
+        workers=args.workers,
         log_level=args.log_level
     ) 
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Peak memory of a download read whole against one streamed to the spool.
+
+Serves a file of the given size from a local HTTP server and downloads it
+in a fresh process per path, so each one's peak RSS is its own:
+
+    read       response.read() into memory, then written to a temp file, as before
+    spool      TelegramService.download_file, which writes it to the spool in chunks
+
+Segmented downloads are turned off, so the spool path uses one connection
+like the old one did.
+
+    python scripts/bench_download_memory.py --size-mb 256
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+MODES = ["read", "spool"]
+
+def peak_rss_mb():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def download_read(url):
+    async with aiohttp.ClientSession() as session, session.get(url) as response:
+        with tempfile.NamedTemporaryFile(suffix=".bin") as temp_file:
+            content = await response.read()
+            temp_file.write(content)
+            return len(content)
+
+async def download_spool(url):
+    from app.services.telegram import telegram_service
+    from app.services.spool import spool_manager
+
+    spool_manager.start()
+    # Set up by TelegramService.start(), which also needs Telegram credentials
+    telegram_service.download_slots = asyncio.Semaphore(1)
+    try:
+        fetched = await telegram_service.download_file(url)
+        fetched.spool.remove()
+        return fetched.size
+    finally:
+        await telegram_service.http_session.close()
+
+async def run_child(args):
+    """Download once and report the peak RSS before and after"""
+    if args.child == "spool":
+        # Count the app's imports in the baseline, not in the download
+        import app.services.telegram
+    baseline = peak_rss_mb()
+    started = time.monotonic()
+    size = await (download_read if args.child == "read" else download_spool)(args.url)
+    elapsed = time.monotonic() - started
+    print(json.dumps({"baseline": baseline, "peak": peak_rss_mb(), "size": size, "seconds": elapsed}))
+
+async def measure(mode, url, spool_dir):
+    env = dict(os.environ, SPOOL_DIR=spool_dir, DOWNLOAD_SEGMENTS="1", PIPELINE_UPLOADS="false")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--child", mode, "--url", url,
+        env=env, stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"{mode} download failed with exit code {process.returncode}")
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+async def run(args):
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, "file.bin")
+    # Written in chunks, so the server doesn't hold the file in memory either
+    with open(path, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    app = web.Application()
+    app.router.add_get("/file.bin", lambda request: web.FileResponse(path))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    url = f"http://127.0.0.1:{args.port}/file.bin"
+
+    print(f"{args.size_mb} MB file, peak RSS of the downloading process")
+    try:
+        for mode in MODES:
+            result = await measure(mode, url, os.path.join(work_dir, "spool"))
+            print(f"  {mode:6s}  {result['seconds']:6.2f}s  peak {result['peak']:7.1f} MB  "
+                  f"({result['peak'] - result['baseline']:+7.1f} MB over {result['baseline']:.1f} MB after imports)")
+    finally:
+        await runner.cleanup()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark peak memory of whole and chunked downloads')
+    parser.add_argument('--size-mb', type=int, default=256, help='Size of the served file')
+    parser.add_argument('--port', type=int, default=8090, help='Port of the local server')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    asyncio.run(run_child(args) if args.child else run(args))
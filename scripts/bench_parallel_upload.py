@@ -0,0 +1,70 @@
+"""Throughput of ParallelUploader against stub connections.
+
+Each stub connection takes a fixed round trip per part plus the time its
+bytes need at a throttled per-connection bandwidth, like a Telegram DC
+connection does. Nothing is sent to Telegram, so no credentials are needed.
+
+    python scripts/bench_parallel_upload.py --size-mb 64 --workers 1,2,4,8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.telegram import ParallelUploader
+
+class StubSender:
+    """Stands in for an MTProtoSender with a round trip and a bandwidth cap"""
+
+    def __init__(self, latency, bandwidth):
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    async def send(self, request):
+        await asyncio.sleep(self.latency + len(request.bytes) / self.bandwidth)
+        return True
+
+class StubUploader(ParallelUploader):
+    """ParallelUploader whose connections are stubs"""
+
+    def __init__(self, latency, bandwidth, **kwargs):
+        super().__init__(None, **kwargs)
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    async def _create_sender(self):
+        return StubSender(self.latency, self.bandwidth)
+
+async def run(args):
+    with tempfile.NamedTemporaryFile(suffix=".bin") as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+        f.flush()
+
+        print(f"{args.size_mb} MB, {args.part_size_kb} KB parts, {args.latency * 1000:.0f} ms round trip, "
+              f"{args.bandwidth_mb} MB/s per connection")
+        baseline = None
+        for workers in args.workers:
+            uploader = StubUploader(
+                args.latency, args.bandwidth_mb * 1024 * 1024, workers=workers, part_size_kb=args.part_size_kb,
+            )
+            started = time.monotonic()
+            await uploader.upload(f.name)
+            elapsed = time.monotonic() - started
+
+            speed = args.size_mb / elapsed
+            baseline = baseline or speed
+            print(f"  {workers:2d} connections: {elapsed:6.2f}s  {speed:7.1f} MB/s  x{speed / baseline:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parallel part uploads against stub connections')
+    parser.add_argument('--size-mb', type=int, default=64, help='Size of the uploaded file')
+    parser.add_argument('--part-size-kb', type=int, default=512, help='Size of each part')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds of round trip per part')
+    parser.add_argument('--bandwidth-mb', type=float, default=8, help='MB/s of each connection')
+    parser.add_argument('--workers', type=lambda value: [int(n) for n in value.split(",")], default=[1, 2, 4, 8],
+                        help='Comma separated connection counts to compare, the first is the baseline')
+    asyncio.run(run(parser.parse_args()))
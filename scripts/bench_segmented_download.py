@@ -0,0 +1,104 @@
+"""Download speed over one connection and over several segments.
+
+Serves a random file from a local HTTP server that throttles every
+connection, like many CDNs do, and downloads it with SegmentedDownloader
+using each segment count in turn. One segment is the plain single
+connection download.
+
+    python scripts/bench_segmented_download.py --size-mb 24 --rate-mb 8 --segments 1,2,4,8
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the downloaded files out of the real spool
+SPOOL_DIR = tempfile.mkdtemp()
+os.environ["SPOOL_DIR"] = SPOOL_DIR
+
+import aiohttp
+from aiohttp import web
+
+from app.services.telegram import FetchedFile, SegmentedDownloader
+from app.services.spool import spool_manager
+
+CHUNK_SIZE = 64 * 1024
+
+def create_app(data, rate):
+    """Serve data at /file, sending at most rate bytes per second per connection"""
+    async def serve(request):
+        start, end = 0, len(data)
+        status = 200
+        headers = {"Accept-Ranges": "bytes", "ETag": '"bench"', "Content-Type": "application/octet-stream"}
+        if request.http_range.start is not None:
+            start = request.http_range.start
+            end = min(request.http_range.stop or len(data), len(data))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(data)}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = end - start
+        await response.prepare(request)
+        started = time.monotonic()
+        try:
+            for position in range(start, end, CHUNK_SIZE):
+                chunk = data[position:min(position + CHUNK_SIZE, end)]
+                await response.write(chunk)
+                # Stay behind the time the bytes sent so far may take at the rate
+                delay = (position + len(chunk) - start) / rate - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        except ConnectionResetError:
+            # The first segment reads the full response only up to its end and closes it
+            pass
+        return response
+
+    app = web.Application()
+    app.router.add_get("/file", serve)
+    return app
+
+async def download(session, url, segments):
+    response = await session.get(url)
+    fetched = FetchedFile("file.bin", response.headers)
+    await SegmentedDownloader(session, url, fetched, segments=segments).download(response, ".bin")
+    return fetched
+
+async def run(args):
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    runner = web.AppRunner(create_app(data, args.rate_mb * 1024 * 1024))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}/file"
+
+    spool_manager.start()
+    print(f"{args.size_mb} MB file, server throttled to {args.rate_mb} MB/s per connection")
+    baseline = None
+    try:
+        async with aiohttp.ClientSession() as session:
+            for segments in args.segments:
+                started = time.monotonic()
+                fetched = await download(session, url, segments)
+                elapsed = time.monotonic() - started
+                fetched.spool.remove()
+
+                speed = args.size_mb / elapsed
+                baseline = baseline or speed
+                print(f"  {segments:2d} segments: {elapsed:6.2f}s  {speed:6.1f} MB/s  x{speed / baseline:.1f}")
+    finally:
+        await runner.cleanup()
+        shutil.rmtree(SPOOL_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark segmented downloads against a throttled local server')
+    parser.add_argument('--size-mb', type=int, default=24, help='Size of the served file')
+    parser.add_argument('--rate-mb', type=float, default=8, help='MB/s the server sends per connection')
+    parser.add_argument('--segments', type=lambda value: [int(n) for n in value.split(",")], default=[1, 2, 4, 8],
+                        help='Comma separated segment counts to compare, the first is the baseline')
+    parser.add_argument('--port', type=int, default=8089, help='Port of the local server')
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""Throughput of task status updates through the old and new database paths.
+
+Runs the same number of concurrent status updates on a scratch SQLite
+database three ways:
+
+    sync       a sync Session per update, as the handlers did before the async engine
+    async      an AsyncSession per update, on the pooled aiosqlite engine
+    writer     through the status writer, which commits them in batches
+
+and reports updates per second together with the longest stall of the
+event loop, which every download and upload shares. Meanwhile, clients
+poll GET /api/file/{task_id} on the app in the same event loop, as they
+do while uploads run, and the p50 and p99 latency of those requests is
+reported too. The status cache is off, so every request reads the
+database. The requests go through httpx (requirements-dev.txt).
+
+    python scripts/bench_status_updates.py --tasks 2000 --concurrency 50 --readers 4
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import itertools
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app's engine is created from DATABASE_URL when it is imported
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+os.environ["STATUS_CACHE_SIZE"] = "0"
+
+import httpx
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.orm import sessionmaker
+
+from app.database.setup import Base, engine, SessionLocal
+from app.models.task import Task
+from app.services.status_writer import status_writer
+from app.main import app
+
+# The engine and session of the sync code, as they were set up before
+sync_engine = create_engine(f"sqlite:///{DATABASE_PATH}", connect_args={"check_same_thread": False})
+SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+
+async def update_sync(task_id, status):
+    db = SyncSessionLocal()
+    try:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        task.status = status
+        db.commit()
+    finally:
+        db.close()
+
+async def update_async(task_id, status):
+    async with SessionLocal() as db:
+        await db.execute(update(Task).where(Task.id == task_id).values(status=status))
+        await db.commit()
+
+async def update_writer(task_id, status):
+    await status_writer.update(task_id, {"status": status})
+
+async def watch_loop(stopped, interval=0.005):
+    """Longest delay of a short sleep while the updates run"""
+    worst = 0
+    while not stopped.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.monotonic() - started - interval)
+    return worst
+
+async def poll_statuses(client, task_ids, stopped, latencies):
+    """Request task statuses one after another, like a client polling for results"""
+    for task_id in itertools.cycle(task_ids):
+        if stopped.is_set():
+            return
+        started = time.monotonic()
+        await client.get(f"/api/file/{task_id}")
+        latencies.append(time.monotonic() - started)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+async def measure(name, update_task, task_ids, concurrency, client, readers):
+    pending = iter(task_ids)
+
+    async def worker():
+        for task_id in pending:
+            await update_task(task_id, name)
+            # Other work of the task, like reading the next chunk of a download
+            await asyncio.sleep(0)
+
+    stopped = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stopped))
+    latencies = []
+    pollers = [asyncio.create_task(poll_statuses(client, task_ids, stopped, latencies)) for _ in range(readers)]
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    stopped.set()
+    stall = await watcher
+    await asyncio.gather(*pollers)
+
+    print(f"  {name:6s}  {elapsed:6.2f}s  {len(task_ids) / elapsed:8.0f} updates/s  loop stalled up to {stall * 1000:6.1f} ms  "
+          f"GET p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  p99 {percentile(latencies, 0.99) * 1000:6.1f} ms")
+
+async def run(args):
+    # Through the app's engine, which switches the database to WAL before the sync updates start
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    task_ids = [f"task-{index}" for index in range(args.tasks)]
+    with sync_engine.begin() as conn:
+        conn.execute(insert(Task), [{"id": task_id, "url": "http://example.com", "status": "pending"} for task_id in task_ids])
+
+    print(f"{args.tasks} status updates by {args.concurrency} concurrent tasks, "
+          f"{args.readers} clients polling /api/file ({DATABASE_PATH})")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await measure("sync", update_sync, task_ids, args.concurrency, client, args.readers)
+        await measure("async", update_async, task_ids, args.concurrency, client, args.readers)
+        await status_writer.start()
+        await measure("writer", update_writer, task_ids, args.concurrency, client, args.readers)
+        await status_writer.stop()
+
+    await engine.dispose()
+    sync_engine.dispose()
+    shutil.rmtree(os.path.dirname(DATABASE_PATH))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark task status updates through the sync and async database paths')
+    parser.add_argument('--tasks', type=int, default=2000, help='Status updates to run')
+    parser.add_argument('--concurrency', type=int, default=50, help='Tasks updating at the same time')
+    parser.add_argument('--readers', type=int, default=4, help='Clients polling task statuses meanwhile')
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,46 @@
+import json
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+import app.main
+from app.database.setup import engine, Base, SessionLocal
+from app.database.migrations import init_db
+from app.models.task import Task
+from app.services.progress import ProgressTracker
+from app.services.status_writer import status_writer
+
+async def write_progress(task_id):
+    await init_db(engine, Base.metadata)
+    async with SessionLocal() as db:
+        await db.execute(insert(Task), [{"id": task_id, "url": "http://example.com/a", "status": "processing"}])
+        await db.commit()
+
+    tracker = ProgressTracker(write_interval=0.05)
+    progress = tracker.start(task_id)
+    progress.set_phase("uploading", 1000)
+    progress.set_uploaded(400)
+
+    await status_writer.start()
+    await tracker.start_writing()
+    await asyncio.sleep(0.3)
+    await tracker.stop_writing()
+    await status_writer.stop()
+
+    async with SessionLocal() as db:
+        written = (await db.get(Task, task_id)).progress
+    await engine.dispose()
+    return json.loads(written)
+
+def test_uploader_writes_progress_for_split_api(monkeypatch):
+    written = asyncio.run(write_progress("running"))
+    assert written["phase"] == "uploading"
+    assert written["uploaded_bytes"] == 400
+
+    # The API process has no uploads of its own and reads the written progress
+    monkeypatch.setattr(app.main, "RUN_UPLOADER", False)
+    response = TestClient(app.main.app).get("/api/file/running")
+
+    assert response.status_code == 425
+    assert response.json()["detail"]["progress"]["uploaded_bytes"] == 400
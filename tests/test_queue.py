@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.config import WORKER_ID, TASK_LEASE_SECONDS
+from app.database.setup import engine, Base, SessionLocal
+from app.database.migrations import init_db
+from app.models.task import Task
+from app.services.queue import task_queue
+from app.services.status_writer import status_writer
+
+async def renew_and_recover():
+    await init_db(engine, Base.metadata)
+    expired = datetime.utcnow() - timedelta(seconds=TASK_LEASE_SECONDS * 2)
+    async with SessionLocal() as db:
+        await db.execute(insert(Task), [
+            {"id": "held", "url": "http://example.com/a", "status": "pending"},
+            # Its worker is gone but the final status was never written
+            {"id": "stuck", "url": "http://example.com/b", "status": "processing",
+             "worker_id": WORKER_ID, "claimed_at": expired},
+        ])
+        await db.commit()
+
+    await status_writer.start()
+    try:
+        assert await task_queue.claim("held")
+        # Claimed long ago as far as the lease is concerned
+        await status_writer.update("held", {"claimed_at": expired})
+
+        await task_queue.renew_claims()
+        await task_queue.recover()
+    finally:
+        task_queue.release("held")
+        await status_writer.stop()
+
+    async with SessionLocal() as db:
+        statuses = {task_id: (await db.get(Task, task_id)).status for task_id in ("held", "stuck")}
+    await engine.dispose()
+    return statuses
+
+def test_only_held_claims_are_renewed():
+    assert asyncio.run(renew_and_recover()) == {"held": "processing", "stuck": "pending"}
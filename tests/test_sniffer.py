@@ -0,0 +1,28 @@
+import struct
+
+from app.services import sniffer
+
+def gif(width, height):
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\x00" * 100
+
+def png(width, height):
+    return b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\x0dIHDR" + struct.pack(">II", width, height) + b"\x00" * 100
+
+def test_gif_is_sent_as_document():
+    content = sniffer.sniff(gif(320, 240))
+    file_type, reason = sniffer.choose_file_type("photo", content, 50000)
+
+    assert content.format == "gif"
+    assert file_type == "document"
+    assert "gif" in reason
+    # Not forced to a document, so Telegram still shows it as an animation
+    assert sniffer.is_document_image(content)
+
+def test_gif_guessed_as_document_keeps_guess():
+    assert sniffer.choose_file_type("document", sniffer.sniff(gif(320, 240)), 50000) == ("document", None)
+
+def test_png_is_sent_as_photo():
+    content = sniffer.sniff(png(320, 240))
+
+    assert sniffer.choose_file_type("photo", content, 50000) == ("photo", None)
+    assert not sniffer.is_document_image(content)
@@ -0,0 +1,21 @@
+from app.services.status_cache import TaskStatusCache
+
+def test_fill_keeps_status_reported_during_read():
+    cache = TaskStatusCache(max_size=10, ttl=60, final_only=False)
+    # A worker reports the task finished while the API reads the older row
+    cache.put({"id": "task", "status": "completed"})
+
+    assert cache.fill({"id": "task", "status": "pending"})["status"] == "completed"
+    assert cache.get("task")["status"] == "completed"
+
+def test_fill_stores_row_without_cached_status():
+    cache = TaskStatusCache(max_size=10, ttl=60, final_only=False)
+
+    assert cache.fill({"id": "task", "status": "pending"})["status"] == "pending"
+    assert cache.get("task")["status"] == "pending"
+
+def test_fill_replaces_expired_status():
+    cache = TaskStatusCache(max_size=10, ttl=-1, final_only=False)
+    cache.put({"id": "task", "status": "processing"})
+
+    assert cache.fill({"id": "task", "status": "completed"})["status"] == "completed"
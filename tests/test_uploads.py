@@ -0,0 +1,64 @@
+import os
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import UPLOAD_DIR
+from app.main import app
+from app.services.uploads import FileUpload
+
+BOUNDARY = "test-boundary"
+CLOSING = f"\r\n--{BOUNDARY}--\r\n".encode()
+
+class StreamedRequest:
+    """The parts of a Starlette request FileUpload reads"""
+
+    def __init__(self, body, chunk_size=1000):
+        self.headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+def multipart_body(data):
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="report.bin"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + data + CLOSING
+
+def uploaded_files():
+    return [name for _, _, names in os.walk(UPLOAD_DIR) for name in names]
+
+def test_receive_saves_complete_body():
+    data = os.urandom(100000)
+    upload = FileUpload()
+    asyncio.run(upload.receive(StreamedRequest(multipart_body(data))))
+
+    with open(upload.path, "rb") as f:
+        assert f.read() == data
+    upload.discard()
+
+@pytest.mark.parametrize("cut", [len(CLOSING), len(CLOSING) + 5000], ids=["before-closing-boundary", "inside-file"])
+def test_receive_rejects_truncated_body(cut):
+    upload = FileUpload()
+    with pytest.raises(ValueError):
+        asyncio.run(upload.receive(StreamedRequest(multipart_body(os.urandom(100000))[:-cut])))
+
+    assert upload.path is None
+    assert uploaded_files() == []
+
+def test_upload_endpoint_rejects_truncated_body():
+    # Not entered as a context manager, so the Telegram clients aren't started
+    client = TestClient(app)
+    response = client.post(
+        "/api/upload/file",
+        content=multipart_body(os.urandom(100000))[:-len(CLOSING)],
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+
+    assert response.status_code == 400
+    assert uploaded_files() == []
@@ -0,0 +1,38 @@
+import asyncio
+import argparse
+import logging
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Run an uploader process that sends queued tasks to Telegram')
+    parser.add_argument('--worker-id', type=str,
+                       default=os.getenv('WORKER_ID'),
+                       help='Unique name of this uploader process (defaults to the host name with a random suffix)')
+    parser.add_argument('--http-port', type=int,
+                       default=int(os.getenv('UPLOADER_HTTP_PORT', '8001')),
+                       help='Port for /metrics, /api/stats and /api/rate-limits of this process (0 disables it)')
+    parser.add_argument('--log-level', type=str,
+                       default="info",
+                       choices=["debug", "info", "warning", "error", "critical"],
+                       help='Log level')
+    args = parser.parse_args()
+    
+    # Read by app.config, so it has to be set before the app is imported
+    if args.worker_id:
+        os.environ['WORKER_ID'] = args.worker_id
+    os.environ['UPLOADER_HTTP_PORT'] = str(args.http_port)
+    
+    logging.basicConfig(
+        level=getattr(logging, args.log_level.upper()),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logging.getLogger('telethon').setLevel(logging.WARNING)
+    
+    from app.services import uploader
+    
+    asyncio.run(uploader.run())